@@ -0,0 +1,194 @@
+"""
+---- bench_projection ----
+Checks every mode in projection_batch.PROJECTION_MODES against the reference
+projection.get_projection_points and measures its throughput.
+
+The poses are random attitudes, altitudes, latitudes and FOVs plus edge cases:
+cameras close to MIN_ANGLE_TO_XY, straight down, at and near the poles, on the
+antimeridian, tiny and huge FOVs and very low and high altitudes. A mode fails
+if any corner is further than projection_batch.MODE_TOLERANCES from the
+reference, or if it disagrees on whether a pose has a projection.
+
+Run from the backend folder:
+    python benchmarks/bench_projection.py [-n POSES] [--seed SEED]
+"""
+
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from projection import MIN_ANGLE_TO_XY, get_geod, get_projection_points  # noqa: E402
+from projection_batch import MODE_TOLERANCES, PROJECTION_MODES, project_batch  # noqa: E402
+
+KINDS = ("random", "horizon", "nadir", "pole", "antimeridian", "fov", "altitude")
+MAX_ALTITUDE = 10_000.0
+
+
+def _random(rng, n):
+    drone_pos = np.c_[rng.uniform(-89, 89, n), rng.uniform(-180, 180, n), rng.uniform(1, MAX_ALTITUDE, n)]
+    drone_angles = np.c_[rng.uniform(-np.pi, np.pi, n), rng.uniform(-0.8, 0.8, n), rng.uniform(-0.8, 0.8, n)]
+    cam_angles = np.c_[rng.uniform(-np.pi, np.pi, n), rng.uniform(-np.pi/2, 0.5, n), rng.uniform(-0.5, 0.5, n)]
+    horiFOV = np.radians(rng.uniform(2, 160, n))
+    vertFOV = np.radians(rng.uniform(2, 160, n))
+    earth_frame = rng.random(n) < 0.3
+    return [drone_pos, drone_angles, cam_angles, horiFOV, vertFOV, earth_frame]
+
+
+def _level(poses, rng):
+    """Level the drone and let the camera only pitch, in earth frame."""
+    n = len(poses[0])
+    poses[1] = np.c_[rng.uniform(-np.pi, np.pi, n), np.zeros(n), np.zeros(n)]
+    poses[2] = np.c_[rng.uniform(-np.pi, np.pi, n), poses[2][:, 1], np.zeros(n)]
+    poses[5] = np.ones(n, dtype=bool)
+
+
+def _near(rng, n, scale=1e-1):
+    """Offsets of random sign and magnitude from 1e-9 to scale."""
+    return rng.choice([-1, 1], n)*10**rng.uniform(-9, np.log10(scale), n)
+
+
+def sample_poses(n, seed=0):
+    """
+    Random and edge case poses in project_batch's format.
+
+    Returns:
+        (poses, kinds), poses being (drone_pos, drone_angles, cam_angles,
+        horiFOV, vertFOV, earth_frame) and kinds the KINDS entry of every pose.
+    """
+    rng = np.random.default_rng(seed)
+    m = max(1, n // len(KINDS))
+    groups = []
+
+    groups.append(_random(rng, n - m*(len(KINDS) - 1)))
+
+    # Top edge of the FOV (half angle horiFOV/2, see project_batch) right at the limit
+    poses = _random(rng, m)
+    _level(poses, rng)
+    poses[2][:, 1] = MIN_ANGLE_TO_XY - poses[3]/2 + _near(rng, m)
+    groups.append(poses)
+
+    poses = _random(rng, m)
+    _level(poses, rng)
+    poses[2][:, 1] = -np.pi/2 + np.where(rng.random(m) < 0.5, 0, _near(rng, m, 1e-3))
+    groups.append(poses)
+
+    poses = _random(rng, m)
+    poses[0][:, 0] = rng.choice([-1, 1], m)*(90 - np.where(rng.random(m) < 0.2, 0, 10**rng.uniform(-6, 0, m)))
+    groups.append(poses)
+
+    poses = _random(rng, m)
+    poses[0][:, 1] = rng.choice([-1, 1], m)*(180 - np.where(rng.random(m) < 0.5, 0, 10**rng.uniform(-9, -3, m)))
+    groups.append(poses)
+
+    poses = _random(rng, m)
+    poses[3] = np.radians(rng.choice([1, 4, 4.1, 170, 179], m))
+    poses[4] = np.radians(rng.choice([1, 4, 4.1, 170, 179], m))
+    groups.append(poses)
+
+    poses = _random(rng, m)
+    poses[0][:, 2] = rng.choice([0.01, 1, MAX_ALTITUDE], m)
+    groups.append(poses)
+
+    poses = tuple(np.concatenate([group[i] for group in groups]) for i in range(6))
+    kinds = np.repeat(KINDS, [len(group[0]) for group in groups])
+    return poses, kinds
+
+
+def reference(drone_pos, drone_angles, cam_angles, horiFOV, vertFOV, earth_frame):
+    """
+    Reference projection of every pose.
+
+    Returns:
+        fov_coords: (N, 4, 2) lat, lon, NaN without a projection.
+        valid: (N,) bools.
+    """
+    keys = ("yaw", "pitch", "roll")
+    fov_coords = np.full((len(drone_pos), 4, 2), np.nan)
+    valid = np.zeros(len(drone_pos), dtype=bool)
+    for k in range(len(drone_pos)):
+        coords, _, _ = get_projection_points(list(drone_pos[k]), dict(zip(keys, drone_angles[k])),
+                                             dict(zip(keys, cam_angles[k])), horiFOV[k], vertFOV[k],
+                                             bool(earth_frame[k]))
+        if not np.isscalar(coords):
+            fov_coords[k] = np.array(coords)[:, :2]
+            valid[k] = True
+    return fov_coords, valid
+
+
+def corner_errors(fov_coords, expected):
+    """Largest distance (m) between corresponding corners of every pose, NaN if a corner is not finite."""
+    a, b = fov_coords.reshape(-1, 2), expected.reshape(-1, 2)
+    ok = np.isfinite(a).all(axis=1) & np.isfinite(b).all(axis=1)
+    dist = np.full(len(a), np.nan)
+    if ok.any():
+        _, _, dist[ok] = get_geod("WGS84").inv(a[ok, 1], a[ok, 0], b[ok, 1], b[ok, 0])
+    return dist.reshape(-1, 4).max(axis=1)
+
+
+def evaluate(poses, kinds, expected, modes=PROJECTION_MODES, repeats=3):
+    """
+    Compare every mode with the reference output expected.
+
+    Returns:
+        dict of mode -> {"max_error_m", "worst_kind", "mismatches", "nonfinite",
+        "poses_per_s", "tolerance_m", "passed"}, where nonfinite counts the
+        poses both sides project but with a non-finite corner error.
+    """
+    expected_coords, expected_valid = expected
+    results = {}
+    for mode in modes:
+        elapsed = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fov_coords, _, _, valid = project_batch(*poses, mode=mode)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        errors = corner_errors(fov_coords, expected_coords)
+        mismatches = int(np.sum(valid != expected_valid))
+        both = valid & expected_valid
+        finite = both & np.isfinite(errors)
+        nonfinite = int(np.sum(both & ~finite))
+        worst = int(np.flatnonzero(finite)[np.argmax(errors[finite])]) if finite.any() else None
+        max_error = float(errors[worst]) if worst is not None else 0.0
+        results[mode] = {
+            "max_error_m": max_error,
+            "worst_kind": str(kinds[worst]) if worst is not None else None,
+            "mismatches": mismatches,
+            "nonfinite": nonfinite,
+            "poses_per_s": len(kinds)/elapsed if elapsed > 0 else np.inf,
+            "tolerance_m": MODE_TOLERANCES[mode],
+            "passed": mismatches == 0 and nonfinite == 0 and max_error <= MODE_TOLERANCES[mode],
+        }
+    return results
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--poses", type=int, default=3000,
+                        help="poses to compare (default: 3000)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random poses (default: 0)")
+    args = parser.parse_args(argv)
+
+    poses, kinds = sample_poses(args.poses, args.seed)
+    start = time.perf_counter()
+    expected = reference(*poses)
+    reference_rate = len(kinds)/(time.perf_counter() - start)
+    results = evaluate(poses, kinds, expected)
+
+    print(f"{len(kinds)} poses, {expected[1].sum()} with a projection")
+    print(f"{'mode':<12} {'max error m':>12} {'tolerance m':>12} {'worst case':>13} {'mismatches':>11} "
+          f"{'non-finite':>11} {'poses/s':>11}")
+    print(f"{'reference':<12} {'':>12} {'':>12} {'':>13} {'':>11} {'':>11} {reference_rate:>11.0f}")
+    for mode, r in results.items():
+        print(f"{mode:<12} {r['max_error_m']:>12.3g} {r['tolerance_m']:>12.3g} {r['worst_kind'] or '':>13} "
+              f"{r['mismatches']:>11} {r['nonfinite']:>11} {r['poses_per_s']:>11.0f}{'' if r['passed'] else '  FAILED'}")
+    return 0 if all(r["passed"] for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
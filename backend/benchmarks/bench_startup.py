@@ -0,0 +1,52 @@
+"""
+---- bench_startup ----
+Measures cold start time of the sniffer, each sample is a fresh interpreter.
+
+Run from the backend folder:
+    python benchmarks/bench_startup.py [-n RUNS]
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CASES = {
+    "python (baseline)": "pass",
+    "import sniffer": "import sniffer",
+    "sniffer --help": "import sys; sys.argv = ['sniffer', '--help']\n"
+                      "from sniffer import main\n"
+                      "try:\n    main()\nexcept SystemExit:\n    pass",
+    "tcp mode imports": "import sniffer.ingest, sniffer.handlers as h, sniffer.telemetry as t, projection, websockets\n"
+                        "h.load_mavutil(); t.quat_to_euler([1, 0, 0, 0])",
+}
+
+
+def time_case(code, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR,
+                       check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--runs", type=int, default=10,
+                        help="interpreter starts per case (default: 10)")
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<20} {'median ms':>10} {'min ms':>10}")
+    for name, code in CASES.items():
+        samples = time_case(code, args.runs)
+        print(f"{name:<20} {statistics.median(samples)*1000:>10.1f} {min(samples)*1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
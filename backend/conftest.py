@@ -0,0 +1,13 @@
+import socket
+
+import pytest
+
+
+@pytest.fixture
+def free_port():
+    """Function returning a free localhost port, TCP unless given socket.SOCK_DGRAM."""
+    def get(kind=socket.SOCK_STREAM):
+        with socket.socket(socket.AF_INET, kind) as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+    return get
@@ -0,0 +1,21 @@
+"""
+---- flightgen ----
+Synthetic MAVLink flights for exercising the sniffer without ArduPilot SITL.
+
+Scripted trajectories for any number of vehicles are encoded as MAVLink 2 at
+configurable rates, optionally with corrupt bytes, and served over TCP or
+written to a .tlog file. The stream only depends on the seed. Run it with
+``python -m flightgen``.
+"""
+
+from .generator import MESSAGE_RATES, FlightGenerator
+from .trajectories import TRAJECTORIES, Pose, Trajectory, euler_to_quat
+
+__all__ = [
+    "MESSAGE_RATES",
+    "TRAJECTORIES",
+    "FlightGenerator",
+    "Pose",
+    "Trajectory",
+    "euler_to_quat",
+]
@@ -0,0 +1,67 @@
+from argparse import ArgumentParser, ArgumentTypeError
+
+from .generator import FlightGenerator, MESSAGE_RATES
+from .trajectories import TRAJECTORIES
+
+DESCRIPTION = """
+---- flightgen ----
+Serves a synthetic, deterministic MAVLink stream on a TCP port, a local
+stand-in for ArduPilot SITL when testing the sniffer.
+"""
+
+
+def parse_rate(value):
+    name, sep, rate = value.partition("=")
+    try:
+        if not sep:
+            raise ValueError
+        return name, float(rate)
+    except ValueError:
+        raise ArgumentTypeError(f"expected MESSAGE=HZ, got {value!r}")
+
+
+def build_parser():
+    """Build the command line parser for the generator."""
+    parser = ArgumentParser(prog="flightgen", description=DESCRIPTION)
+    parser.add_argument("-p", "--port", type=int,
+                        help="port to serve on, the sniffer's --port (default: 5762)", default=5762)
+    parser.add_argument("-t", "--trajectory", choices=sorted(TRAJECTORIES),
+                        help="flight to script (default: orbit)", default="orbit")
+    parser.add_argument("-n", "--vehicles", type=int,
+                        help="number of vehicles (default: 1)", default=1)
+    parser.add_argument("-r", "--rate", type=parse_rate, action="append", default=[], metavar="MESSAGE=HZ",
+                        help="message rate, may be repeated (defaults: {})".format(
+                            ", ".join(f"{k}={v}" for k, v in MESSAGE_RATES.items())))
+    parser.add_argument("-s", "--seed", type=int,
+                        help="random seed (default: 0)", default=0)
+    parser.add_argument("-c", "--corrupt", type=float,
+                        help="probability of corrupting each packet (default: 0)", default=0.0)
+    parser.add_argument("--speed", type=float,
+                        help="playback speed, 0 sends as fast as possible (default: 1)", default=1.0)
+    parser.add_argument("-d", "--duration", type=float,
+                        help="seconds of flight before it starts over, closing every connection "
+                             "(default: endless)", default=None)
+    parser.add_argument("--tlog", metavar="PATH",
+                        help="write a .tlog file of --duration seconds instead of serving", default=None)
+    return parser
+
+
+def main(argv=None):
+    """Command line entry point, argv defaults to sys.argv[1:]."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        generator = FlightGenerator(args.trajectory, args.vehicles, dict(args.rate), args.seed, args.corrupt)
+    except ValueError as e:
+        parser.error(str(e))
+
+    from .server import serve, write_tlog
+
+    if args.tlog:
+        if args.duration is None:
+            parser.error("--tlog requires --duration")
+        write_tlog(generator, args.tlog, args.duration)
+        return
+
+    import asyncio
+    asyncio.run(serve(generator, args.port, speed=args.speed, duration=args.duration))
@@ -0,0 +1,157 @@
+import heapq
+import math
+import random
+
+from .trajectories import TRAJECTORIES, euler_to_quat
+
+# Default messages and rates (Hz) sent by every vehicle
+MESSAGE_RATES = {
+    "HEARTBEAT": 1,
+    "GLOBAL_POSITION_INT": 10,
+    "ATTITUDE": 50,
+    "GIMBAL_DEVICE_ATTITUDE_STATUS": 20,
+    "CAMERA_FOV_STATUS": 2,
+    "SYSTEM_TIME": 1,
+}
+
+# Home of the first vehicle (lat, lon in degrees), further vehicles are placed east of it
+DEFAULT_HOME = (58.3949, 15.5767)
+VEHICLE_SPACING = 600.0
+R_EARTH = 6371001
+
+GIMBAL_DEVICE_FLAGS_YAW_IN_VEHICLE_FRAME = 1 << 5
+
+
+def _heartbeat(mav, t, pose, lat, lon, epoch):
+    # MAV_TYPE_FIXED_WING, MAV_AUTOPILOT_ARDUPILOTMEGA, armed, MAV_STATE_ACTIVE
+    return mav.heartbeat_encode(1, 3, 128, 0, 4)
+
+
+def _global_position_int(mav, t, pose, lat, lon, epoch):
+    return mav.global_position_int_encode(
+        _boot_ms(t), round(lat*1e7), round(lon*1e7), round(pose.alt*1e3), round(pose.alt*1e3),
+        round(pose.vn*100), round(pose.ve*100), round(pose.vd*100),
+        round(math.degrees(pose.yaw) % 360*100))
+
+
+def _attitude(mav, t, pose, lat, lon, epoch):
+    return mav.attitude_encode(_boot_ms(t), pose.roll, pose.pitch, pose.yaw, 0.0, 0.0, pose.yawspeed)
+
+
+def _gimbal_device_attitude_status(mav, t, pose, lat, lon, epoch):
+    return mav.gimbal_device_attitude_status_encode(
+        0, 0, _boot_ms(t), GIMBAL_DEVICE_FLAGS_YAW_IN_VEHICLE_FRAME,
+        euler_to_quat(*pose.gimbal), 0.0, 0.0, 0.0, 0)
+
+
+def _camera_fov_status(mav, t, pose, lat, lon, epoch):
+    nan = float("nan")
+    return mav.camera_fov_status_encode(
+        _boot_ms(t), round(lat*1e7), round(lon*1e7), round(pose.alt*1e3),
+        0x7FFFFFFF, 0x7FFFFFFF, 0x7FFFFFFF, [nan]*4, pose.hfov, pose.vfov)
+
+
+def _system_time(mav, t, pose, lat, lon, epoch):
+    return mav.system_time_encode(round((epoch + t)*1e6), _boot_ms(t))
+
+
+ENCODERS = {
+    "HEARTBEAT": _heartbeat,
+    "GLOBAL_POSITION_INT": _global_position_int,
+    "ATTITUDE": _attitude,
+    "GIMBAL_DEVICE_ATTITUDE_STATUS": _gimbal_device_attitude_status,
+    "CAMERA_FOV_STATUS": _camera_fov_status,
+    "SYSTEM_TIME": _system_time,
+}
+
+
+def _boot_ms(t):
+    return int(t*1000) & 0xFFFFFFFF
+
+
+class FlightGenerator:
+    """
+    Deterministic MAVLink 2 stream of one or more scripted vehicles.
+
+    Args:
+        trajectory: name of a trajectory in TRAJECTORIES.
+        vehicles: number of vehicles, with sysid 1..vehicles.
+        rates: dict of message name -> rate in Hz, overriding MESSAGE_RATES.
+            A rate of 0 disables the message.
+        seed: seed for the trajectory parameters, message phases and corruption.
+        corrupt: probability per packet of flipping a byte in it or inserting
+            random bytes before it.
+        home: (lat, lon) of the first vehicle in degrees.
+
+    Every call to packets() replays the same stream from t=0.
+    """
+
+    def __init__(self, trajectory="orbit", vehicles=1, rates=None, seed=0, corrupt=0.0, home=DEFAULT_HOME):
+        if trajectory not in TRAJECTORIES:
+            raise ValueError(f"unknown trajectory {trajectory!r}, expected one of {sorted(TRAJECTORIES)}")
+        if vehicles < 1:
+            raise ValueError("vehicles must be at least 1")
+        if not 0 <= corrupt <= 1:
+            raise ValueError("corrupt must be a probability between 0 and 1")
+        self.rates = dict(MESSAGE_RATES)
+        for name, rate in (rates or {}).items():
+            if name not in ENCODERS:
+                raise ValueError(f"unknown message {name!r}, expected one of {sorted(ENCODERS)}")
+            if rate < 0:
+                raise ValueError(f"rate of {name} must not be negative")
+            self.rates[name] = rate
+        self.seed = seed
+        self.corrupt = corrupt
+
+        rng = random.Random(seed)
+        self.trajectories = [TRAJECTORIES[trajectory](rng) for _ in range(vehicles)]
+        self.homes = [(home[0], home[1] + math.degrees(i*VEHICLE_SPACING/(R_EARTH*math.cos(math.radians(home[0])))))
+                      for i in range(vehicles)]
+        # Each vehicle sends each message with its own phase, avoiding bursts
+        self.phases = [{name: rng.random() for name in ENCODERS} for _ in range(vehicles)]
+
+    def _schedule(self):
+        queue = []
+        for vehicle in range(len(self.trajectories)):
+            for name, rate in self.rates.items():
+                if rate > 0:
+                    queue.append((self.phases[vehicle][name]/rate, vehicle, name, 0))
+        heapq.heapify(queue)
+        return queue
+
+    def packets(self, duration=None, epoch=0.0):
+        """
+        Yield (t, packet bytes) in time order, t in seconds since the start.
+
+        Runs forever unless duration is given. epoch is the Unix time (s) of
+        t=0, sent in SYSTEM_TIME.
+        """
+        from pymavlink.dialects.v20 import common as mavlink2
+
+        mavs = [mavlink2.MAVLink(None, srcSystem=i + 1, srcComponent=1) for i in range(len(self.trajectories))]
+        corrupt_rng = random.Random(f"{self.seed}:corrupt")
+        queue = self._schedule()
+        while queue:
+            t, vehicle, name, k = queue[0]
+            if duration is not None and t >= duration:
+                return
+            rate = self.rates[name]
+            heapq.heapreplace(queue, ((self.phases[vehicle][name] + k + 1)/rate, vehicle, name, k + 1))
+
+            pose = self.trajectories[vehicle].pose(t)
+            home_lat, home_lon = self.homes[vehicle]
+            lat = home_lat + math.degrees(pose.north/R_EARTH)
+            lon = home_lon + math.degrees(pose.east/(R_EARTH*math.cos(math.radians(lat))))
+            mav = mavs[vehicle]
+            buf = bytes(ENCODERS[name](mav, t, pose, lat, lon, epoch).pack(mav))
+            # pack() uses but does not advance the sequence number, send() normally does
+            mav.seq = (mav.seq + 1) % 256
+            yield t, self._maybe_corrupt(buf, corrupt_rng)
+
+    def _maybe_corrupt(self, buf, rng):
+        if self.corrupt == 0 or rng.random() >= self.corrupt:
+            return buf
+        if rng.random() < 0.5:
+            i = rng.randrange(len(buf))
+            return buf[:i] + bytes([buf[i] ^ rng.randrange(1, 256)]) + buf[i+1:]
+        return bytes(rng.randrange(256) for _ in range(rng.randint(1, 8))) + buf
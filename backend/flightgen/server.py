@@ -0,0 +1,104 @@
+import asyncio
+import struct
+import time
+
+# Unix time (s) of the first record in generated .tlog files
+TLOG_EPOCH = 1_700_000_000
+
+
+# Bytes buffered for a client before it is dropped for not keeping up
+MAX_CLIENT_BUFFER = 1 << 20
+
+
+async def stream(writers, generator, speed=1.0, duration=None, epoch=None, joined=None):
+    """
+    Write one flight of the generator's packets to every asyncio StreamWriter
+    in the set writers, which may change while the flight runs.
+
+    speed scales the playback, 1 is real time and 0 as fast as possible, in
+    which case the flight waits for the asyncio.Event joined while there are
+    no writers. epoch is the Unix time sent in SYSTEM_TIME for t=0, by default
+    now, so SYSTEM_TIME follows the wall clock at speed 1.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    if epoch is None:
+        epoch = time.time()
+    for i, (t, buf) in enumerate(generator.packets(duration, epoch)):
+        if speed > 0:
+            delay = start + t/speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            while not writers:
+                joined.clear()
+                await joined.wait()
+            if i % 256 == 0:
+                # Paced by the slowest client, and lets other tasks run
+                await asyncio.gather(*(writer.drain() for writer in writers), return_exceptions=True)
+                await asyncio.sleep(0)
+        for writer in list(writers):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                writers.discard(writer)
+                writer.close()
+            else:
+                writer.write(buf)
+
+
+async def serve(generator, port, host="localhost", speed=1.0, duration=None):
+    """
+    Serve the generator's flight on a TCP port until cancelled.
+
+    Like a simulator, there is one flight on one clock for every client, so a
+    client that connects late starts at the current time of the flight and
+    redundant links carry the same bytes at the same time. At speed 0 the
+    flight only runs while a client is connected. After duration seconds of
+    flight every connection is closed and the flight starts over, like the
+    vehicles rebooting.
+    """
+    writers = set()
+    handlers = set()
+    joined = asyncio.Event()
+
+    async def handle(reader, writer):
+        handlers.add(asyncio.current_task())
+        writers.add(writer)
+        joined.set()
+        try:
+            # Whatever the client sends is ignored until it hangs up
+            while await reader.read(4096):
+                pass
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled by the server shutting down, which ends the connection anyway
+            pass
+        finally:
+            handlers.discard(asyncio.current_task())
+            writers.discard(writer)
+            writer.close()
+
+    async def fly():
+        while True:
+            await stream(writers, generator, speed, duration, joined=joined)
+            for writer in writers:
+                writer.close()
+            writers.clear()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        try:
+            await asyncio.gather(server.serve_forever(), fly())
+        finally:
+            # Closing the server waits for the open connections
+            for task in list(handlers):
+                task.cancel()
+
+
+def write_tlog(generator, path, duration, epoch=TLOG_EPOCH):
+    """
+    Write duration seconds of the generator's stream to a .tlog file, which the
+    sniffer can replay with -f.
+    """
+    with open(path, "wb") as f:
+        for t, buf in generator.packets(duration, epoch):
+            f.write(struct.pack(">Q", round((epoch + t)*1e6)))
+            f.write(buf)
@@ -0,0 +1,215 @@
+import bisect
+import math
+from collections import namedtuple
+
+GRAVITY = 9.81
+
+# Step (s) used for the numerical derivatives of a trajectory's position
+DERIVATIVE_STEP = 0.05
+
+# Pose of a vehicle at one point in time:
+#  north, east, alt: position in meters relative to the vehicle's home
+#  yaw, pitch, roll: vehicle attitude in radians
+#  vn, ve, vd: velocity in m/s
+#  yawspeed: turn rate in rad/s
+#  gimbal: (yaw, pitch, roll) of the gimbal in the vehicle frame, in radians
+#  hfov, vfov: camera field of view in degrees
+Pose = namedtuple("Pose", ["north", "east", "alt", "yaw", "pitch", "roll",
+                           "vn", "ve", "vd", "yawspeed", "gimbal", "hfov", "vfov"])
+
+
+def euler_to_quat(yaw, pitch, roll):
+    """
+    Convert Euler angles to a scalar-first quaternion [w, x, y, z].
+
+    Inverse of the sniffer's Rotation.as_euler('zyx'), i.e. the extrinsic
+    rotation about z by yaw, then y by pitch, then x by roll.
+    """
+    cy, sy = math.cos(yaw/2), math.sin(yaw/2)
+    cp, sp = math.cos(pitch/2), math.sin(pitch/2)
+    cr, sr = math.cos(roll/2), math.sin(roll/2)
+    return [cr*cp*cy - sr*sp*sy,
+            sr*cp*cy + cr*sp*sy,
+            cr*sp*cy - sr*cp*sy,
+            cr*cp*sy + sr*sp*cy]
+
+
+class Trajectory:
+    """
+    Scripted flight of one vehicle.
+
+    Subclasses draw their parameters from the random.Random passed to the
+    constructor and implement position(). The attitude is derived from the
+    path, a coordinated turn gives the roll and the climb rate the pitch.
+    """
+
+    hfov = 60.0
+    vfov = 45.0
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def position(self, t):
+        """Return (north, east, alt) in meters at time t."""
+        raise NotImplementedError
+
+    def gimbal(self, t):
+        """Return gimbal (yaw, pitch, roll) in the vehicle frame at time t."""
+        return (0.0, math.radians(-70), 0.0)
+
+    def fov(self, t):
+        """Return (hfov, vfov) in degrees at time t."""
+        return (self.hfov, self.vfov)
+
+    def pose(self, t):
+        """Return the Pose of the vehicle at time t."""
+        h = DERIVATIVE_STEP
+        n0, e0, a0 = self.position(t - h)
+        n1, e1, a1 = self.position(t)
+        n2, e2, a2 = self.position(t + h)
+        vn, ve, vu = (n2 - n0)/(2*h), (e2 - e0)/(2*h), (a2 - a0)/(2*h)
+        an, ae = (n2 - 2*n1 + n0)/h**2, (e2 - 2*e1 + e0)/h**2
+        speed2 = vn**2 + ve**2
+        yawspeed = (vn*ae - ve*an)/speed2 if speed2 > 1e-9 else 0.0
+        speed = math.sqrt(speed2)
+        hfov, vfov = self.fov(t)
+        return Pose(north=n1, east=e1, alt=a1,
+                    yaw=math.atan2(ve, vn),
+                    pitch=math.atan2(vu, speed),
+                    roll=math.atan(speed*yawspeed/GRAVITY),
+                    vn=vn, ve=ve, vd=-vu, yawspeed=yawspeed,
+                    gimbal=self.gimbal(t), hfov=hfov, vfov=vfov)
+
+
+class Orbit(Trajectory):
+    """Constant speed loiter circle around home."""
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.radius = rng.uniform(80, 200)
+        self.alt = rng.uniform(60, 150)
+        self.rate = rng.choice((-1, 1)) * rng.uniform(12, 20) / self.radius
+        self.phase = rng.uniform(0, 2*math.pi)
+
+    def position(self, t):
+        angle = self.phase + self.rate*t
+        return (self.radius*math.cos(angle), self.radius*math.sin(angle), self.alt)
+
+
+class _Path:
+    """Closed 2D path of line and arc segments, sampled by distance along it."""
+
+    def __init__(self):
+        self.segments = []
+        self.starts = []
+        self.length = 0.0
+
+    def _add(self, segment, length):
+        self.segments.append(segment)
+        self.starts.append(self.length)
+        self.length += length
+
+    def line(self, start, end):
+        length = math.dist(start, end)
+        self._add(("line", start, end, length), length)
+
+    def arc(self, center, radius, start_angle, sweep):
+        length = abs(sweep)*radius
+        self._add(("arc", center, radius, start_angle, sweep, length), length)
+
+    def point(self, s):
+        s %= self.length
+        i = bisect.bisect_right(self.starts, s) - 1
+        segment = self.segments[i]
+        frac = (s - self.starts[i])/segment[-1]
+        if segment[0] == "line":
+            _, start, end, _ = segment
+            return (start[0] + frac*(end[0] - start[0]), start[1] + frac*(end[1] - start[1]))
+        _, center, radius, start_angle, sweep, _ = segment
+        angle = start_angle + frac*sweep
+        return (center[0] + radius*math.cos(angle), center[1] + radius*math.sin(angle))
+
+
+class Lawnmower(Trajectory):
+    """
+    Survey pattern: parallel north-south legs joined by half circle turns and
+    a transit leg south of the legs back to the start.
+    """
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        legs = 2*rng.randint(2, 4)
+        leg_length = rng.uniform(300, 500)
+        spacing = rng.uniform(40, 80)
+        self.alt = rng.uniform(80, 120)
+        self.speed = rng.uniform(12, 18)
+        self.path = _Path()
+        for k in range(legs):
+            east = k*spacing
+            start, end = (0.0, east), (leg_length, east)
+            if k % 2:
+                start, end = end, start
+            self.path.line(start, end)
+            if k < legs - 1:
+                # Turn around the far end of the leg, towards the next leg
+                center = (end[0], east + spacing/2)
+                sweep = -math.pi if k % 2 else math.pi
+                self.path.arc(center, spacing/2, -math.pi/2, sweep)
+        # Quarter turns into and out of the westward transit leg
+        r = spacing/2
+        last_east = (legs - 1)*spacing
+        self.path.arc((0.0, last_east - r), r, math.pi/2, math.pi/2)
+        self.path.line((-r, last_east - r), (-r, r))
+        self.path.arc((0.0, r), r, -math.pi, math.pi/2)
+
+    def position(self, t):
+        north, east = self.path.point(self.speed*t)
+        return (north, east, self.alt)
+
+
+class AggressiveTurns(Trajectory):
+    """Fast figure eight with steep banked turns and altitude changes."""
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.size = rng.uniform(80, 150)
+        self.rate = rng.uniform(25, 35)/self.size
+        self.alt = rng.uniform(60, 100)
+        self.climb = rng.uniform(10, 30)
+
+    def position(self, t):
+        angle = self.rate*t
+        return (self.size*math.sin(angle),
+                self.size*math.sin(angle)*math.cos(angle),
+                self.alt + self.climb*math.sin(2*angle))
+
+
+class GimbalSweep(Orbit):
+    """
+    Slow orbit while the gimbal sweeps yaw, pitch (down to near the horizon)
+    and roll and the camera zooms, exercising the FOV reduction.
+    """
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.radius = rng.uniform(30, 60)
+        self.rate = rng.choice((-1, 1)) * rng.uniform(3, 6) / self.radius
+        self.period = rng.uniform(8, 15)
+
+    def gimbal(self, t):
+        w = 2*math.pi*t/self.period
+        return (math.radians(90)*math.sin(w),
+                math.radians(-55 + 35*math.sin(0.7*w)),
+                math.radians(10)*math.sin(1.3*w))
+
+    def fov(self, t):
+        zoom = 0.5 + 0.5*math.sin(2*math.pi*t/(3*self.period))
+        return (30 + 60*zoom, 20 + 45*zoom)
+
+
+TRAJECTORIES = {
+    "orbit": Orbit,
+    "lawnmower": Lawnmower,
+    "turns": AggressiveTurns,
+    "gimbal-sweep": GimbalSweep,
+}
@@ -8,6 +8,17 @@ MIN_FOV_ANGLE = np.pi/45    # 4 degrees
 # Approximate mean Earth radius in meters (used if needed for other computations)
 R_EARTH = 6371001
 
+# Geod instances are expensive to build, so they are created once per ellipsoid
+_geods = {}
+
+def get_geod(ellps="WGS84"):
+    """
+    Return a shared Geod for the given ellipsoid, building it on first use.
+    """
+    if ellps not in _geods:
+        _geods[ellps] = Geod(ellps=ellps)
+    return _geods[ellps]
+
 def dist_to_degs_new(drone_pos, points):
     """
     Convert planar offsets (dx, dy) in meters from the drone to latitude/longitude.
@@ -20,8 +31,8 @@ def dist_to_degs_new(drone_pos, points):
         new_points: list of [lat, lon, 0] ground coordinates in degrees.
     """
     new_points = []
-    # Initialize geodetic converter on the WGS84 ellipsoid
-    geod = Geod(ellps="WGS84")
+    # Shared geodetic converter on the WGS84 ellipsoid
+    geod = get_geod("WGS84")
     for dy, dx, dz in points:
         # First, move from original lat/lon by north-south offset (bearing 0 or 180)
         lon1, lat1, _ = geod.fwd(
@@ -214,12 +225,12 @@ def verify_FOV(corners, rotated_corners, start_angles, drone_angles, cam_angles,
                 index_common = (i + 1) % 2
 
             # Lower selected axis by 3 degrees for corner i and its high neighbour
-            angles[i][index_common] -= deg_to_rad(signs[i][[index_common]])*3
+            angles[i][index_common] -= deg_to_rad(signs[i][index_common])*3
             angles[(i+i_diff) % 4][index_common] = angles[i][index_common]
 
             # Update vectors for this pair
             corners[i] = np.append(1, np.tan(angles[i]))
-            corners[(i+i_diff) % 4] = np.append(1, np.tan(angles[i+i_diff]))
+            corners[(i+i_diff) % 4] = np.append(1, np.tan(angles[(i+i_diff) % 4]))
 
         # If FOV angular separation violated, return failure
         if not FOV_angle_big_enough(angles):
@@ -227,6 +238,9 @@ def verify_FOV(corners, rotated_corners, start_angles, drone_angles, cam_angles,
 
         # Recompute rotated corners after adjusting angles
         rotated_corners = rotate_FOV(corners, drone_angles, cam_angles, earth_frame)
+        # If no corner is below the threshold anymore, return failure
+        if rotated_corners == np.inf:
+            return np.inf, np.inf
     # Return final valid rotated corners and their angles
     return rotated_corners, angles
 
@@ -0,0 +1,240 @@
+"""
+---- projection_batch ----
+Vectorized version of projection.get_projection_points, projecting N camera
+poses at once with numpy. It follows the same steps as the reference code,
+including the iterative FOV reduction, so the "exact" mode gives the same
+results to floating point precision.
+
+Modes:
+- "exact": the corners are converted to lat/lon with pyproj geodesics on
+  WGS84, like dist_to_degs_new.
+- "spherical": the geodesics are approximated by local spheres with the
+  WGS84 radii of curvature at the drone, which avoids pyproj.
+
+MODE_TOLERANCES declares how far each mode may be from the reference.
+"""
+
+import numpy as np
+
+from projection import MIN_ANGLE_TO_XY, MIN_FOV_ANGLE, deg_to_rad, get_geod
+
+PROJECTION_MODES = ("exact", "spherical")
+
+# Maximum corner error (m) of each mode against projection.get_projection_points
+# for altitudes up to 10 km, checked by benchmarks/bench_projection.py
+MODE_TOLERANCES = {"exact": 1e-6, "spherical": 1.0}
+
+# WGS84 semi-major axis (m) and first eccentricity squared
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+# Per corner signs of the [horizontal, vertical] half angles
+CORNER_SIGNS = np.array([[1, 1], [-1, 1], [-1, -1], [1, -1]], dtype=float)
+
+# Step (radians) a too high corner is lowered by per iteration, as in verify_FOV
+REDUCTION_STEP = deg_to_rad(1)*3
+
+
+def rotation_matrices(angles):
+    """
+    Rotation matrices Rz(yaw) Ry(-pitch) Rx(-roll), as in projection.rotate_vect.
+
+    Args:
+        angles: (N, 3) array of yaw, pitch, roll in radians.
+
+    Returns:
+        (N, 3, 3) array.
+    """
+    n = len(angles)
+    cy, sy = np.cos(angles[:, 0]), np.sin(angles[:, 0])
+    cp, sp = np.cos(-angles[:, 1]), np.sin(-angles[:, 1])
+    cr, sr = np.cos(-angles[:, 2]), np.sin(-angles[:, 2])
+    zeros, ones = np.zeros(n), np.ones(n)
+    Rz = np.stack([cy, -sy, zeros, sy, cy, zeros, zeros, zeros, ones], axis=-1).reshape(n, 3, 3)
+    Ry = np.stack([cp, zeros, sp, zeros, ones, zeros, -sp, zeros, cp], axis=-1).reshape(n, 3, 3)
+    Rx = np.stack([ones, zeros, zeros, zeros, cr, -sr, zeros, sr, cr], axis=-1).reshape(n, 3, 3)
+    return Rz @ Ry @ Rx
+
+
+def angles_to_xy(vects):
+    """Elevation angles (radians) of (..., 3) vectors above the XY-plane."""
+    norm = np.linalg.norm(vects, axis=-1)
+    return np.pi/2 - np.arccos(np.clip(vects[..., 2]/norm, -1.0, 1.0))
+
+
+def corners_from_angles(angles):
+    """Direction vectors [1, tan(h), tan(v)] of (..., 2) corner angles."""
+    return np.concatenate([np.ones(angles.shape[:-1] + (1,)), np.tan(angles)], axis=-1)
+
+
+def _reduce_FOV(angles, signs, rotation, rows):
+    """
+    Vectorized projection.verify_FOV, lowering the highest corner of every row
+    until it is below MIN_ANGLE_TO_XY. Like verify_FOV the corner is picked
+    once, other corners may stay above the limit.
+
+    Args:
+        angles: (N, 4, 2) corner angles, adjusted in place.
+        signs: (N, 4, 2) signs of the starting angles.
+        rotation: (N, 3, 3) camera (and drone) rotation.
+        rows: (N,) bool, rows still valid, cleared in place for failed rows.
+
+    Returns:
+        (N, 4, 3) rotated corner vectors.
+    """
+    rotated = np.einsum('nij,nkj->nki', rotation, corners_from_angles(angles))
+    active = rows.copy()
+    corner_index = np.arange(4)
+    n = np.arange(len(rotated))
+    elev = angles_to_xy(rotated)
+    # Highest corner, the last one on ties like get_highest_corner_index
+    highest = 3 - np.argmax(elev[:, ::-1], axis=1)
+    while True:
+        active &= elev[n, highest] >= MIN_ANGLE_TO_XY
+        idx = np.nonzero(active)[0]
+        if len(idx) == 0:
+            return rotated
+
+        i = highest[idx]
+        prev_i, next_i = (i - 1) % 4, (i + 1) % 4
+        prev_high = elev[idx, prev_i] >= MIN_ANGLE_TO_XY
+        next_high = elev[idx, next_i] >= MIN_ANGLE_TO_XY
+        sub = angles[idx]
+        sub_signs = signs[idx]
+        m = np.arange(len(idx))
+
+        # Both or neither neighbour too high: lower both angles of the corner
+        # and move the shared sides of the neighbours with it
+        sym = prev_high == next_high
+        s_m, s_i = m[sym], i[sym]
+        sub[s_m, s_i] -= sub_signs[s_m, s_i]*REDUCTION_STEP
+        sub[s_m, prev_i[sym], s_i % 2] = sub[s_m, s_i, s_i % 2]
+        sub[s_m, next_i[sym], (s_i + 1) % 2] = sub[s_m, s_i, (s_i + 1) % 2]
+
+        # One neighbour too high: lower the side shared with that neighbour
+        one = ~sym
+        o_m, o_i = m[one], i[one]
+        o_prev = prev_high[one]
+        common = np.where(o_prev, o_i % 2, (o_i + 1) % 2)
+        other = np.where(o_prev, prev_i[one], next_i[one])
+        sub[o_m, o_i, common] -= sub_signs[o_m, o_i, common]*REDUCTION_STEP
+        sub[o_m, other, common] = sub[o_m, o_i, common]
+        angles[idx] = sub
+
+        # Fail rows where adjacent sides came closer than MIN_FOV_ANGLE
+        side = corner_index % 2
+        diff = np.abs(sub[:, corner_index, side] - sub[:, (corner_index + 1) % 4, side])
+        failed = np.any(diff < MIN_FOV_ANGLE, axis=1)
+
+        rotated[idx] = np.einsum('nij,nkj->nki', rotation[idx], corners_from_angles(sub))
+        elev[idx] = angles_to_xy(rotated[idx])
+        # As in rotate_FOV, fail rows where no corner is below the limit anymore
+        failed |= np.all(elev[idx] >= MIN_ANGLE_TO_XY, axis=1)
+        rows[idx[failed]] = False
+        active[idx[failed]] = False
+
+
+def _geodesic_offsets(lat, lon, north, east):
+    """Move north then east along geodesics, as in dist_to_degs_new."""
+    geod = get_geod("WGS84")
+    lon1, lat1, _ = geod.fwd(lon, lat, np.where(north >= 0, 0.0, 180.0), np.abs(north))
+    lon2, lat2, _ = geod.fwd(lon1, lat1, np.where(east >= 0, 90.0, 270.0), np.abs(east))
+    return lat2, lon2
+
+
+def _spherical_offsets(lat, lon, north, east):
+    """
+    Move north then east like _geodesic_offsets, approximating the meridian by
+    a circle with the meridional radius of curvature and the eastward geodesic
+    by a great circle with the prime vertical radius of curvature.
+    """
+    phi0 = np.radians(lat)
+    # Meridional radius at the midpoint, found with one fixed point iteration
+    def meridional(phi):
+        return WGS84_A*(1 - WGS84_E2)/(1 - WGS84_E2*np.sin(phi)**2)**1.5
+    phi1 = phi0 + north/meridional(phi0)
+    phi1 = phi0 + north/meridional((phi0 + phi1)/2)
+    lam1 = np.radians(lon)
+    # Continue over the pole onto the opposite meridian
+    over = np.abs(phi1) > np.pi/2
+    phi1 = np.where(over, np.sign(phi1)*np.pi - phi1, phi1)
+    lam1 = np.where(over, lam1 + np.pi, lam1)
+
+    prime = WGS84_A/np.sqrt(1 - WGS84_E2*np.sin(phi1)**2)
+    delta = east/prime
+    sin_phi2 = np.sin(phi1)*np.cos(delta)
+    phi2 = np.arcsin(np.clip(sin_phi2, -1.0, 1.0))
+    lam2 = lam1 + np.arctan2(np.sin(delta)*np.cos(phi1), np.cos(delta) - np.sin(phi1)*sin_phi2)
+    lon2 = (np.degrees(lam2) + 180) % 360 - 180
+    return np.degrees(phi2), lon2
+
+
+def project_batch(drone_pos, drone_angles, cam_angles, horiFOV, vertFOV, earth_frame=False, mode="exact"):
+    """
+    Compute the ground projection of the camera FOV for N poses at once.
+
+    Args:
+        drone_pos: (N, 3) lat, lon, alt of the drones in degrees/meters.
+        drone_angles, cam_angles: (N, 3) yaw, pitch, roll in radians.
+        horiFOV, vertFOV: (N,) FOV angles in radians.
+        earth_frame: bool or (N,) bools, skip the drone rotation if True.
+        mode: one of PROJECTION_MODES.
+
+    Returns:
+        fov_coords: (N, 4, 2) lat, lon of the ground corners.
+        corner_offset: (N, 4, 2) fractional cropping offsets.
+        frame_size: (N, 2) w, h image coverage ratios.
+        valid: (N,) bools, False where get_projection_points returns inf. The
+            other outputs are NaN for those rows.
+    """
+    if mode not in PROJECTION_MODES:
+        raise ValueError(f"unknown projection mode {mode!r}, expected one of {PROJECTION_MODES}")
+    drone_pos = np.asarray(drone_pos, dtype=float).reshape(-1, 3)
+    drone_angles = np.asarray(drone_angles, dtype=float).reshape(-1, 3)
+    cam_angles = np.asarray(cam_angles, dtype=float).reshape(-1, 3)
+    n = len(drone_pos)
+    horiFOV = np.broadcast_to(np.asarray(horiFOV, dtype=float), (n,))
+    vertFOV = np.broadcast_to(np.asarray(vertFOV, dtype=float), (n,))
+    earth_frame = np.broadcast_to(np.asarray(earth_frame, dtype=bool), (n,))
+
+    # get_projection_points passes the FOVs to compute_FOV_corners and
+    # calc_frame_size in swapped order, the horizontal half angle is vertFOV/2
+    start_angles = CORNER_SIGNS*np.stack([vertFOV/2, horiFOV/2], axis=-1)[:, None, :]
+    angles = start_angles.copy()
+    signs = np.sign(start_angles)
+
+    rotation = rotation_matrices(cam_angles)
+    drone_rotation = rotation_matrices(drone_angles)
+    rotation = np.where(earth_frame[:, None, None], rotation, drone_rotation @ rotation)
+
+    rotated = np.einsum('nij,nkj->nki', rotation, corners_from_angles(angles))
+    valid = np.any(angles_to_xy(rotated) < MIN_ANGLE_TO_XY, axis=1)
+    rotated = _reduce_FOV(angles, signs, rotation, valid)
+
+    fov_coords = np.full((n, 4, 2), np.nan)
+    corner_offset = np.full((n, 4, 2), np.nan)
+    frame_size = np.full((n, 2), np.nan)
+    if not valid.any():
+        return fov_coords, corner_offset, frame_size, valid
+
+    # Fractional cropping offsets and coverage, as in calc_frame_size
+    start_dist = np.tan(start_angles[valid])
+    reduced_dist = np.tan(angles[valid])
+    offset = np.abs(start_dist - reduced_dist)/(2*np.abs(start_dist))
+    corner_offset[valid] = offset
+    frame_size[valid, 0] = 1 - offset[:, 1, 0] - offset[:, 0, 0]
+    frame_size[valid, 1] = 1 - offset[:, 3, 1] - offset[:, 0, 1]
+
+    # Ground intersections relative to the drone, as in calc_ground_point
+    vects = rotated[valid]
+    alt = drone_pos[valid, 2]
+    ground = vects*(alt[:, None]/(-vects[:, :, 2]))[:, :, None]
+    ground[:, :, 2] += alt[:, None]
+
+    lat = np.repeat(drone_pos[valid, 0], 4)
+    lon = np.repeat(drone_pos[valid, 1], 4)
+    north, east = ground[:, :, 0].ravel(), ground[:, :, 1].ravel()
+    offsets = _geodesic_offsets if mode == "exact" else _spherical_offsets
+    lat2, lon2 = offsets(lat, lon, north, east)
+    fov_coords[valid] = np.stack([lat2, lon2], axis=-1).reshape(-1, 4, 2)
+    return fov_coords, corner_offset, frame_size, valid
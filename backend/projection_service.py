@@ -0,0 +1,227 @@
+"""
+---- projection_service ----
+HTTP service projecting batches of camera poses, e.g. planned waypoints, with
+the vectorized projection in projection_batch.
+
+POST /project with either
+- JSON: {"poses": [{"lat", "lon", "alt", "yaw", "pitch", "roll", "cam_yaw",
+  "cam_pitch", "cam_roll", "hfov", "vfov", "earth_frame"}, ...]}
+  Angles are in degrees, lat, lon, alt, hfov and vfov are required. lat must
+  be within +-90, alt above 0 and hfov, vfov between 0 and 180.
+  Returns {"results": [...]} with one object per pose in the same format as
+  the sniffer's websocket frames.
+- application/octet-stream: little endian float64 rows of POSE_COLUMNS.
+  Returns float64 rows of RESULT_COLUMNS, NaN where there is no projection.
+
+Query parameters:
+- mode: a projection mode from projection_batch.PROJECTION_MODES (default: exact)
+- stream=1: stream the results chunk by chunk, as newline delimited JSON
+  objects or binary rows, instead of building the whole response first.
+
+Arguments:
+-p: port to serve on
+--host: host to serve on
+-j: number of worker threads
+--max-poses: maximum number of poses per request
+--max-requests: maximum number of requests projecting at the same time
+"""
+
+import json
+import math
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+from projection_batch import PROJECTION_MODES, project_batch
+
+POSE_COLUMNS = ("lat", "lon", "alt", "yaw", "pitch", "roll", "cam_yaw", "cam_pitch", "cam_roll",
+                "hfov", "vfov", "earth_frame")
+REQUIRED_COLUMNS = ("lat", "lon", "alt", "hfov", "vfov")
+RESULT_COLUMNS = ("has_projection",
+                  *(f"corner{i}_{key}" for i in range(4) for key in ("lat", "lon", "x", "y")),
+                  "w", "h")
+
+# Poses handed to a worker at a time
+CHUNK_SIZE = 4096
+
+
+class RequestError(Exception):
+    """A request the service refuses, with the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def poses_from_json(body):
+    """Convert a JSON request body to an (N, len(POSE_COLUMNS)) array."""
+    if not isinstance(body, dict) or not isinstance(body.get("poses"), list):
+        raise RequestError('expected a JSON object with a "poses" list')
+    poses = np.zeros((len(body["poses"]), len(POSE_COLUMNS)))
+    for row, pose in enumerate(body["poses"]):
+        if not isinstance(pose, dict):
+            raise RequestError(f"pose {row} is not an object")
+        missing = [key for key in REQUIRED_COLUMNS if key not in pose]
+        if missing:
+            raise RequestError(f"pose {row} is missing {', '.join(missing)}")
+        try:
+            poses[row] = [float(pose.get(key, 0)) for key in POSE_COLUMNS]
+        except (TypeError, ValueError):
+            raise RequestError(f"pose {row} has a value that is not a number")
+    return poses
+
+
+def poses_from_bytes(data):
+    """Convert a binary request body to an (N, len(POSE_COLUMNS)) array."""
+    row_size = 8*len(POSE_COLUMNS)
+    if len(data) % row_size:
+        raise RequestError(f"binary body must be rows of {len(POSE_COLUMNS)} little endian float64")
+    return np.frombuffer(data, dtype="<f8").reshape(-1, len(POSE_COLUMNS))
+
+
+def validate_poses(poses):
+    """Raise a RequestError for the first pose outside the supported ranges."""
+    if not np.isfinite(poses).all():
+        raise RequestError("poses must be finite numbers")
+    col = {key: poses[:, i] for i, key in enumerate(POSE_COLUMNS)}
+    checks = (
+        (np.abs(col["lat"]) <= 90, "lat must be between -90 and 90"),
+        (col["alt"] > 0, "alt must be above 0"),
+        ((col["hfov"] > 0) & (col["hfov"] < 180), "hfov must be between 0 and 180"),
+        ((col["vfov"] > 0) & (col["vfov"] < 180), "vfov must be between 0 and 180"),
+    )
+    for ok, message in checks:
+        if not ok.all():
+            raise RequestError(f"pose {int(np.argmin(ok))}: {message}")
+
+
+def project_poses(poses, mode="exact"):
+    """
+    Project an array of poses in the request format.
+
+    Returns:
+        (N, len(RESULT_COLUMNS)) float64 array.
+    """
+    fov_coords, corner_offset, frame_size, valid = project_batch(
+        poses[:, 0:3], np.radians(poses[:, 3:6]), np.radians(poses[:, 6:9]),
+        np.radians(poses[:, 9]), np.radians(poses[:, 10]), poses[:, 11] != 0, mode=mode)
+    corners = np.concatenate([fov_coords, corner_offset], axis=-1).reshape(len(poses), 16)
+    return np.concatenate([valid[:, None], corners, frame_size], axis=-1)
+
+
+def results_to_json(results):
+    """
+    Convert rows of RESULT_COLUMNS to dicts like the sniffer's frames. Rows
+    with a non-finite value have no projection, JSON has no NaN.
+    """
+    frames = []
+    for row in results.tolist():
+        frame = {"has_projection": bool(row[0]) and all(math.isfinite(value) for value in row)}
+        if frame["has_projection"]:
+            for i in range(4):
+                lat, lon, x, y = row[1 + 4*i:5 + 4*i]
+                frame[f"corner{i}"] = {"lat": lat, "lon": lon, "offset": {"x": x, "y": y}}
+            frame["frame_size"] = {"w": row[17], "h": row[18]}
+        frames.append(frame)
+    return frames
+
+
+def create_app(workers=4, max_poses=100_000, max_requests=8):
+    """
+    Create the Flask app.
+
+    Args:
+        workers: threads projecting chunks of poses.
+        max_poses: maximum number of poses in one request.
+        max_requests: requests allowed to project at the same time, further
+            requests are answered with 503.
+    """
+    app = Flask(__name__)
+    CORS(app)
+    # Largest of the two formats, JSON poses are far bigger than binary ones
+    app.config["MAX_CONTENT_LENGTH"] = max_poses*512
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="projection")
+    slots = threading.BoundedSemaphore(max_requests)
+
+    def chunks(poses, mode):
+        """Project poses on the pool, yielding result chunks in order."""
+        pending = []
+        for start in range(0, len(poses), CHUNK_SIZE):
+            pending.append(pool.submit(project_poses, poses[start:start + CHUNK_SIZE], mode))
+            # Keep every worker busy without queueing the whole request
+            if len(pending) > workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+    @app.errorhandler(RequestError)
+    def request_error(e):
+        return jsonify(error=str(e)), e.status
+
+    @app.errorhandler(413)
+    def too_large(e):
+        return jsonify(error="request body too large"), 413
+
+    @app.post("/project")
+    def project():
+        mode = request.args.get("mode", "exact")
+        if mode not in PROJECTION_MODES:
+            raise RequestError(f"unknown mode {mode!r}, expected one of {', '.join(PROJECTION_MODES)}")
+        binary = request.mimetype == "application/octet-stream"
+        if binary:
+            poses = poses_from_bytes(request.get_data())
+        else:
+            poses = poses_from_json(request.get_json(silent=True))
+        if len(poses) > max_poses:
+            raise RequestError(f"at most {max_poses} poses per request", 413)
+        validate_poses(poses)
+        if not slots.acquire(blocking=False):
+            raise RequestError("too many requests in progress", 503)
+
+        if request.args.get("stream") in ("1", "true"):
+            def generate():
+                for results in chunks(poses, mode):
+                    if binary:
+                        yield results.astype("<f8").tobytes()
+                    else:
+                        yield "".join(json.dumps(frame) + "\n" for frame in results_to_json(results))
+            response = Response(generate(), mimetype="application/octet-stream" if binary else "application/x-ndjson")
+            # Released when the server closes the response, even if it never started streaming
+            response.call_on_close(slots.release)
+            return response
+
+        try:
+            results = list(chunks(poses, mode))
+        finally:
+            slots.release()
+        results = np.concatenate(results) if results else np.zeros((0, len(RESULT_COLUMNS)))
+        if binary:
+            return Response(results.astype("<f8").tobytes(), mimetype="application/octet-stream")
+        return jsonify(results=results_to_json(results))
+
+    return app
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-p", "--port", type=int,
+                        help="port to serve on (default: 8778)", default=8778)
+    parser.add_argument("--host",
+                        help="host to serve on (default: localhost)", default="localhost")
+    parser.add_argument("-j", "--workers", type=int,
+                        help="projection worker threads (default: 4)", default=4)
+    parser.add_argument("--max-poses", type=int,
+                        help="maximum poses per request (default: 100000)", default=100_000)
+    parser.add_argument("--max-requests", type=int,
+                        help="maximum requests projecting at the same time (default: 8)", default=8)
+    args = parser.parse_args(argv)
+    app = create_app(args.workers, args.max_poses, args.max_requests)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
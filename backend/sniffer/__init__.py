@@ -0,0 +1,20 @@
+"""
+---- sniffer ----
+A tool for sending MavLink data from a chosen port to a chosen local websocket.
+
+Importing the package has no side effects and is cheap: pymavlink, scipy,
+websockets and the projection code are only imported once the mode that needs
+them is started. Run it with ``python -m sniffer``.
+"""
+
+from .cli import DEFAULT_MESSAGES, build_parser, main
+from .telemetry import GIMBAL_DEVICE_FLAGS, TelemetryState, unpack_mavlink_flags
+
+__all__ = [
+    "DEFAULT_MESSAGES",
+    "GIMBAL_DEVICE_FLAGS",
+    "TelemetryState",
+    "build_parser",
+    "main",
+    "unpack_mavlink_flags",
+]
@@ -0,0 +1,133 @@
+from argparse import ArgumentParser, ArgumentTypeError
+from functools import partial
+
+DESCRIPTION = """
+---- mavlink_sniffer ----
+A tool for sending MavLink data from a chosen port to a chosen local websocket
+
+Arguments:
+-p: port to sniff
+-e: MAVLink endpoints to merge instead of the port
+-w: websocket port
+-m: message type to filter by
+-f: reads .tlog file instead
+--shm: also publish frames to a shared memory ring buffer, see sniffer.shm
+"""
+
+DEFAULT_MESSAGES = ["GLOBAL_POSITION_INT", "ATTITUDE", "GIMBAL_DEVICE_ATTITUDE_STATUS", "CAMERA_FOV_STATUS"]
+
+
+def endpoint(value):
+    from .ingest import parse_endpoint
+    try:
+        parse_endpoint(value, None)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+    return value
+
+
+def build_parser():
+    """Build the command line parser for the sniffer."""
+    parser = ArgumentParser(prog="sniffer", description=DESCRIPTION)
+    parser.add_argument("-p", "--port", type=int,
+                        help="port to sniff (default: 5762)", default=5762)
+    parser.add_argument("-e", "--endpoint", dest="endpoints", type=endpoint, action="append", default=[],
+                        help="MAVLink source to merge, tcp:HOST:PORT, udpin:HOST:PORT, udpout:HOST:PORT "
+                             "or tlog:PATH to follow a growing .tlog, may be repeated "
+                             "(default: tcp:localhost:<port>)")
+    parser.add_argument("-w", "--websocket-port", type=int,
+                        help="websocket port (default: 8777)", default=8777)
+    parser.add_argument("-m", "--messages", nargs='+',
+                        help="mavlink message to filter by", default=list(DEFAULT_MESSAGES))
+    parser.add_argument("-f", "--filepath", dest="path",
+                        help="filepath to .tlog file ", default=None)
+    parser.add_argument("--stats-interval", type=float,
+                        help="seconds between logging link statistics, 0 disables (default: 0)", default=0)
+    parser.add_argument("--shm", metavar="NAME",
+                        help="also publish frames to the shared memory ring buffer NAME", default=None)
+    parser.add_argument("--shm-slots", type=int,
+                        help="frames kept in the shared memory ring buffer (default: 64)", default=64)
+    return parser
+
+
+def ingest_messages(messages):
+    """The messages to ingest from live links, SYSTEM_TIME is always needed to trace frame latency."""
+    return messages if "SYSTEM_TIME" in messages else messages + ["SYSTEM_TIME"]
+
+
+async def log_stats(ingest, hub, interval):
+    """Log the statistics of every link and the latency of every client each interval seconds."""
+    import asyncio
+    import logging
+    from .latency import summary
+
+    log = logging.getLogger(__name__)
+    while True:
+        await asyncio.sleep(interval)
+        for spec, stats in ingest.stats().items():
+            log.info("%s: %s %.1f msg/s, %d received, %d duplicates, %d lost (%.1f%%), %d bad, latency %.1f ms (max %.1f ms)",
+                     spec, "up" if stats["connected"] else "down", stats["rate"], stats["received"],
+                     stats["duplicates"], stats["lost"], 100*stats["loss"], stats["bad"],
+                     stats["latency_ms"], stats["latency_max_ms"])
+        for name, latency in hub.latency.items():
+            log.info("%s: %s", name, summary(latency.snapshot()))
+
+
+async def serve(args):
+    """Serve the mode selected by args on the websocket port until cancelled."""
+    import asyncio
+    import itertools
+    import websockets
+    from .handlers import FrameHub, filereader, framesender
+
+    if args.path:
+        async with websockets.serve(partial(filereader, args=args), 'localhost', args.websocket_port):
+            await asyncio.Future()
+
+    from .ingest import Ingest
+    from .latency import now_ms
+    from .telemetry import TelemetryState
+
+    state = TelemetryState()
+    hub = FrameHub()
+    ring = None
+    if args.shm:
+        from .shm import FrameRingWriter
+        ring = FrameRingWriter(args.shm, args.shm_slots)
+
+    frame_numbers = itertools.count(1)
+
+    def on_message(msg):
+        ingested = now_ms()
+        # The projection is only needed when it changed and someone is listening
+        if not state.update(msg.to_dict(), msg.get_srcSystem()) or (not hub.queues and ring is None):
+            return
+        frame = state.frame()
+        frame["timing"] = {"seq": next(frame_numbers), "source": state.source_time(),
+                           "ingest": ingested, "projected": now_ms()}
+        if ring is not None:
+            ring.publish(frame)
+        if hub.queues:
+            hub.publish(frame)
+
+    try:
+        ingest = Ingest(args.endpoints or ['tcp:localhost:{}'.format(args.port)],
+                        ingest_messages(args.messages), on_message)
+        tasks = [ingest.run()]
+        if args.stats_interval > 0:
+            tasks.append(log_stats(ingest, hub, args.stats_interval))
+        async with websockets.serve(partial(framesender, hub=hub), 'localhost', args.websocket_port):
+            await asyncio.gather(*tasks)
+    finally:
+        if ring is not None:
+            ring.close()
+
+
+def main(argv=None):
+    """Command line entry point, argv defaults to sys.argv[1:]."""
+    args = build_parser().parse_args(argv)
+
+    import asyncio
+    import logging
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    asyncio.run(serve(args))
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from .latency import LatencyStats, now_ms, summary
+
+log = logging.getLogger(__name__)
+
+
+def load_mavutil():
+    """
+    Import pymavlink's mavutil on first use.
+
+    GIMBAL_DEVICE_ATTITUDE_STATUS and CAMERA_FOV_STATUS only exist in MAVLink 2,
+    so the MAVLink 2 dialects are selected unless the environment says otherwise.
+    """
+    os.environ.setdefault("MAVLINK20", "1")
+    from pymavlink import mavutil
+    return mavutil
+
+
+class FrameHub:
+    """
+    Fans frames out to the connected websocket clients.
+
+    Every client gets its own bounded queue, a client that falls behind loses
+    its oldest frames instead of slowing down ingest or the other clients.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.queues = set()
+        # Client name -> LatencyStats of the connected clients
+        self.latency = {}
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.maxsize)
+        self.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    def publish(self, frame):
+        for queue in self.queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+
+async def framesender(ws, hub):
+    """
+    Websocket handler sending the frames published on the hub to the client.
+
+    The send time is added to each frame's "timing", and echo messages from
+    the client are aggregated in hub.latency, see sniffer.latency.
+    """
+    queue = hub.subscribe()
+    name = "{}:{}".format(*ws.remote_address[:2])
+    latency = hub.latency[name] = LatencyStats()
+
+    async def send():
+        while True:
+            frame = await queue.get()
+            timing = dict(frame["timing"], sent=now_ms())
+            latency.sent(timing)
+            await ws.send(json.dumps(dict(frame, timing=timing)))
+
+    sender = asyncio.ensure_future(send())
+    try:
+        # Returns when the client disconnects
+        async for message in ws:
+            latency.handle(message)
+    finally:
+        sender.cancel()
+        hub.unsubscribe(queue)
+        del hub.latency[name]
+        if latency.echoes:
+            log.info("%s: disconnected, %s", name, summary(latency.snapshot()))
+
+
+async def filereader(ws, args):
+    """
+    Websocket handler replaying the messages of the .tlog file at args.path
+    with 1~ sec intervals.
+    """
+    mavutil = load_mavutil()
+    mlog = mavutil.mavlink_connection(args.path)
+    while True:
+        l = mlog.recv_match(blocking=True, type=args.messages)
+        if l is not None:
+            d = l.to_dict()
+            d.update({'timestamp': time.strftime("%Y-%m-%d %H:%M:%S",
+                                time.localtime(l._timestamp))})
+            await ws.send(json.dumps(d))
+            await asyncio.sleep(1)
@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import os
+import struct
+from collections import OrderedDict
+
+from .handlers import load_mavutil
+
+log = logging.getLogger(__name__)
+
+# Reconnect delays (s), doubled after every failed attempt up to the max
+BACKOFF_START = 0.5
+BACKOFF_MAX = 10.0
+# Seconds without data before a link is considered dropped
+STALE_TIMEOUT = 5.0
+# Seconds between heartbeats on udpout links and stale checks on UDP links
+UDP_TICK = 1.0
+# Seconds a received packet is remembered for deduplication
+DEDUP_WINDOW = 1.0
+# Poll interval (s) when tail-following a .tlog file
+TLOG_POLL = 0.05
+
+TLOG_TIMESTAMP = struct.Struct(">Q")
+
+
+class LinkStats:
+    """
+    Counters for one link.
+
+    rate is messages per second over the last full second, lost is the number
+    of packets missing from the sequence numbers seen on this link and latency
+    is how much later than the first copy, received on any link, this link
+    delivered each packet.
+    """
+
+    def __init__(self):
+        self.connected = False
+        self.connects = 0
+        self.received = 0
+        self.duplicates = 0
+        self.bad = 0
+        self.lost = 0
+        self.last_rx = None
+        self.rate = 0.0
+        self._bucket_start = None
+        self._bucket_count = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._last_seq = {}
+
+    def packet(self, now, src, seq, latency):
+        """Record a valid packet from src (sysid, compid) arriving at now."""
+        self.received += 1
+        self.last_rx = now
+        last = self._last_seq.get(src)
+        if last is not None:
+            self.lost += (seq - last - 1) % 256
+        self._last_seq[src] = seq
+        self._latency_sum += latency
+        self._latency_max = max(self._latency_max, latency)
+        if self._bucket_start is None:
+            self._bucket_start = now
+        elif now - self._bucket_start >= 1:
+            self.rate = self._bucket_count / (now - self._bucket_start)
+            self._bucket_start = now
+            self._bucket_count = 0
+        self._bucket_count += 1
+
+    def reset_sequence(self):
+        """Forget sequence numbers, gaps across a reconnect are not counted as loss."""
+        self._last_seq.clear()
+
+    def snapshot(self, now):
+        """Return the stats as a dict."""
+        rate = self.rate
+        if self.last_rx is None or now - self.last_rx > 2:
+            rate = 0.0
+        total = self.received + self.lost
+        return {
+            "connected": self.connected,
+            "connects": self.connects,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "bad": self.bad,
+            "lost": self.lost,
+            "loss": self.lost / total if total else 0.0,
+            "rate": rate,
+            "latency_ms": 1000 * self._latency_sum / self.received if self.received else 0.0,
+            "latency_max_ms": 1000 * self._latency_max,
+            "idle_s": now - self.last_rx if self.last_rx is not None else None,
+        }
+
+
+class Deduplicator:
+    """
+    Remembers packets by (sysid, compid, seq, msgid, crc) for a time window so
+    copies of a packet arriving on other links can be dropped.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW):
+        self.window = window
+        self.seen = OrderedDict()
+
+    def first_arrival(self, key, now):
+        """
+        Returns:
+            None if key has not been seen within the window, in which case it is
+            remembered as arriving now, else the time it first arrived.
+        """
+        while self.seen:
+            oldest_key, oldest = next(iter(self.seen.items()))
+            if now - oldest <= self.window:
+                break
+            del self.seen[oldest_key]
+        first = self.seen.get(key)
+        if first is None:
+            self.seen[key] = now
+        return first
+
+
+class Link:
+    """
+    One MAVLink source. run() keeps it connected, reconnecting with backoff,
+    and hands the received bytes to the Ingest.
+    """
+
+    def __init__(self, spec, ingest):
+        self.spec = spec
+        self.ingest = ingest
+        self.stats = LinkStats()
+        self.parser = None
+
+    async def session(self):
+        """Receive until the link drops, raising OSError or ConnectionError."""
+        raise NotImplementedError
+
+    def feed(self, data):
+        self.ingest.feed(self, data, asyncio.get_running_loop().time())
+
+    async def run(self):
+        delay = BACKOFF_START
+        while True:
+            self.parser = self.ingest.new_parser()
+            received = self.stats.received
+            try:
+                await self.session()
+                log.warning("%s: closed", self.spec)
+            except (OSError, ConnectionError, EOFError) as e:
+                log.warning("%s: %s", self.spec, e)
+            except Exception:
+                # A bug in one link must not stop the others
+                log.exception("%s: unexpected error", self.spec)
+            finally:
+                self.stats.connected = False
+                self.stats.reset_sequence()
+            if self.stats.received > received:
+                delay = BACKOFF_START
+            await asyncio.sleep(delay)
+            delay = min(2*delay, BACKOFF_MAX)
+
+    def connected(self):
+        self.stats.connected = True
+        self.stats.connects += 1
+        log.info("%s: connected", self.spec)
+
+
+class TcpLink(Link):
+    """Connects to a TCP server, e.g. tcp:localhost:5762."""
+
+    def __init__(self, spec, ingest, host, port):
+        super().__init__(spec, ingest)
+        self.host = host
+        self.port = port
+
+    async def session(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connected()
+        try:
+            while True:
+                # A half-open connection never ends, treat silence as a drop.
+                # asyncio.wait, unlike wait_for, never swallows a cancellation
+                read = asyncio.ensure_future(reader.read(4096))
+                try:
+                    await asyncio.wait({read}, timeout=STALE_TIMEOUT)
+                finally:
+                    read.cancel()
+                if not read.done():
+                    raise ConnectionError(f"nothing received for {STALE_TIMEOUT} s")
+                data = read.result()
+                if not data:
+                    break
+                self.feed(data)
+        finally:
+            writer.close()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, link):
+        self.link = link
+        self.error = None
+
+    def datagram_received(self, data, addr):
+        self.link.feed(data)
+
+    def error_received(self, exc):
+        self.error = exc
+
+
+class UdpLink(Link):
+    """
+    Listens on (udpin:HOST:PORT) or sends to (udpout:HOST:PORT) a UDP port.
+
+    UDP has no connection to restore, the link only counts as disconnected
+    while nothing has been received for STALE_TIMEOUT and the socket stays
+    open so data is received as soon as it resumes. udpout links send a
+    heartbeat every UDP_TICK so the other end knows where to send to.
+    """
+
+    def __init__(self, spec, ingest, host, port, listen):
+        super().__init__(spec, ingest)
+        self.host = host
+        self.port = port
+        self.listen = listen
+
+    async def session(self):
+        loop = asyncio.get_running_loop()
+        if self.listen:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.port))
+        else:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), remote_addr=(self.host, self.port))
+        self.connected()
+        started = loop.time()
+        try:
+            while True:
+                if not self.listen:
+                    transport.sendto(self.ingest.heartbeat())
+                if protocol.error is not None:
+                    raise protocol.error
+                await asyncio.sleep(UDP_TICK)
+                last_rx = self.stats.last_rx if self.stats.last_rx is not None else started
+                stale = loop.time() - max(last_rx, started) > STALE_TIMEOUT
+                if stale and self.stats.connected:
+                    log.warning("%s: nothing received for %s s", self.spec, STALE_TIMEOUT)
+                    self.stats.connected = False
+                    self.stats.reset_sequence()
+                elif not stale and not self.stats.connected:
+                    self.connected()
+        finally:
+            transport.close()
+
+
+class TlogLink(Link):
+    """
+    Follows a .tlog file being written by another program, like tail -f,
+    starting at its current end (tlog:PATH). The file is reopened if it is
+    truncated or replaced.
+    """
+
+    def __init__(self, spec, ingest, path):
+        super().__init__(spec, ingest)
+        self.path = path
+
+    async def session(self):
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            inode = os.fstat(f.fileno()).st_ino
+            self.connected()
+            buf = b""
+            while True:
+                data = f.read()
+                if data:
+                    buf = self.feed_records(buf + data)
+                    # The file may keep growing, let the other tasks run
+                    await asyncio.sleep(0)
+                    continue
+                st = os.stat(self.path)
+                if st.st_ino != inode or st.st_size < f.tell():
+                    raise EOFError("file truncated or replaced")
+                await asyncio.sleep(TLOG_POLL)
+
+    def feed_records(self, buf):
+        """Feed the complete timestamp + packet records in buf, returning the rest."""
+        packets = []
+        while len(buf) >= TLOG_TIMESTAMP.size + 3:
+            size = _packet_size(buf, TLOG_TIMESTAMP.size)
+            if size is None:
+                # Not at a record boundary, skip ahead one byte, the parser's
+                # CRC check drops any garbage this lets through
+                buf = buf[1:]
+                continue
+            end = TLOG_TIMESTAMP.size + size
+            if len(buf) < end:
+                break
+            packets.append(buf[TLOG_TIMESTAMP.size:end])
+            buf = buf[end:]
+        if packets:
+            self.feed(b"".join(packets))
+        return buf
+
+
+def _packet_size(buf, i):
+    """Size of the MAVLink packet starting at buf[i], None if there is none."""
+    if buf[i] == 0xFD:
+        signed = buf[i + 2] & 0x01
+        return 12 + buf[i + 1] + (13 if signed else 0)
+    if buf[i] == 0xFE:
+        return 8 + buf[i + 1]
+    return None
+
+
+def parse_endpoint(spec, ingest):
+    """
+    Create the Link for an endpoint spec: tcp:HOST:PORT, udpin:HOST:PORT,
+    udpout:HOST:PORT or tlog:PATH.
+    """
+    kind, sep, rest = spec.partition(":")
+    if not sep or not rest:
+        raise ValueError(f"invalid endpoint {spec!r}")
+    if kind == "tlog":
+        return TlogLink(spec, ingest, rest)
+    host, sep, port = rest.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"endpoint {spec!r} must be {kind}:HOST:PORT")
+    if kind == "tcp":
+        return TcpLink(spec, ingest, host, int(port))
+    if kind in ("udpin", "udpout"):
+        return UdpLink(spec, ingest, host, int(port), listen=kind == "udpin")
+    raise ValueError(f"unknown endpoint type {kind!r} in {spec!r}")
+
+
+class Ingest:
+    """
+    Merges several MAVLink links into one stream without duplicates.
+
+    Args:
+        endpoints: endpoint specs, see parse_endpoint().
+        messages: message types passed on, None passes all.
+        on_message: called with every new message of the wanted types.
+        dedup_window: seconds a packet is remembered for deduplication.
+    """
+
+    def __init__(self, endpoints, messages=None, on_message=None, dedup_window=DEDUP_WINDOW):
+        if not endpoints:
+            raise ValueError("at least one endpoint is needed")
+        self.mavlink = load_mavutil().mavlink
+        self.messages = set(messages) if messages is not None else None
+        self.on_message = on_message
+        self.dedup = Deduplicator(dedup_window)
+        self.links = [parse_endpoint(spec, self) for spec in endpoints]
+        self._heartbeat = None
+
+    def new_parser(self):
+        parser = self.mavlink.MAVLink(None)
+        parser.robust_parsing = True
+        return parser
+
+    def heartbeat(self):
+        """Packed GCS heartbeat, sent on udpout links."""
+        if self._heartbeat is None:
+            mav = self.mavlink.MAVLink(None, srcSystem=255, srcComponent=190)
+            msg = mav.heartbeat_encode(self.mavlink.MAV_TYPE_GCS, self.mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0)
+            self._heartbeat = bytes(msg.pack(mav))
+        return self._heartbeat
+
+    def feed(self, link, data, now):
+        """Parse bytes received on link at time now and pass on new messages."""
+        for msg in link.parser.parse_buffer(data) or []:
+            if msg.get_type() == "BAD_DATA":
+                link.stats.bad += 1
+                continue
+            src = (msg.get_srcSystem(), msg.get_srcComponent())
+            key = (*src, msg.get_seq(), msg.get_msgId(), msg.get_crc())
+            first = self.dedup.first_arrival(key, now)
+            link.stats.packet(now, src, msg.get_seq(), 0.0 if first is None else now - first)
+            if first is not None:
+                link.stats.duplicates += 1
+                continue
+            if self.on_message is not None and (self.messages is None or msg.get_type() in self.messages):
+                # A message the callback cannot handle must not stop the links
+                try:
+                    self.on_message(msg)
+                except Exception:
+                    log.exception("%s: handling %s failed", link.spec, msg.get_type())
+
+    def stats(self):
+        """Return the stats of every link as a dict keyed by endpoint spec."""
+        now = asyncio.get_running_loop().time()
+        return {link.spec: link.stats.snapshot(now) for link in self.links}
+
+    async def run(self):
+        """Keep all links running until cancelled."""
+        await asyncio.gather(*(link.run() for link in self.links))
@@ -0,0 +1,125 @@
+"""
+---- sniffer.latency ----
+End-to-end latency of the frames sent to websocket clients.
+
+Every frame has a "timing" dict of Unix times in ms:
+- seq: frame number
+- source: when the vehicle sent the newest message in the frame, from its
+  time_boot_ms and SYSTEM_TIME, None if the vehicle has not sent SYSTEM_TIME
+- ingest: when the sniffer received that message
+- projected: when the projection was done
+- sent: when the frame was sent to this client
+
+A client may answer a frame with an echo message
+    {"type": "echo", "seq": 12, "received": 1700000000123.4, "rendered": 1700000000140.1}
+where rendered is optional. The stages below are then aggregated per client.
+The times come from different clocks, so stages across machines include their
+clock offset.
+"""
+
+import json
+import time
+from collections import OrderedDict, deque
+
+# Stage name -> (start, end) timing keys
+STAGES = {
+    "link": ("source", "ingest"),
+    "projection": ("ingest", "projected"),
+    "queue": ("projected", "sent"),
+    "network": ("sent", "received"),
+    "render": ("received", "rendered"),
+    "glass_to_glass": ("source", "rendered"),
+}
+PERCENTILES = (50, 90, 99)
+
+# Samples kept per stage and sent frames remembered per client
+LATENCY_WINDOW = 1000
+PENDING_FRAMES = 256
+
+
+def now_ms():
+    """Unix time in ms, the clock of every timing."""
+    return time.time()*1000
+
+
+def percentile(values, p):
+    """Nearest rank p-th percentile of sorted values."""
+    rank = max(1, -(-len(values)*p // 100))
+    return values[rank - 1]
+
+
+class LatencyStats:
+    """
+    Latency samples of one client, the last LATENCY_WINDOW per stage.
+
+    Call sent() with the timing of every frame sent and echo() with the times
+    the client reported for it.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, pending=PENDING_FRAMES):
+        self.samples = {stage: deque(maxlen=window) for stage in STAGES}
+        self.pending = OrderedDict()
+        self.max_pending = pending
+        self.echoes = 0
+        self.unknown = 0
+
+    def sent(self, timing):
+        self.pending[timing["seq"]] = timing
+        while len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+
+    def echo(self, seq, received, rendered=None):
+        """
+        Add the stages of frame seq.
+
+        Returns:
+            False if the frame is not one of the last sent, else True.
+        """
+        timing = self.pending.pop(seq, None)
+        if timing is None:
+            self.unknown += 1
+            return False
+        times = dict(timing, received=received, rendered=rendered)
+        for stage, (start, end) in STAGES.items():
+            if times[start] is not None and times[end] is not None:
+                self.samples[stage].append(times[end] - times[start])
+        self.echoes += 1
+        return True
+
+    def handle(self, message):
+        """
+        Handle a message from the client, ignoring anything but valid echoes.
+
+        Returns:
+            True if it was an echo of a known frame.
+        """
+        try:
+            d = json.loads(message)
+            if d.get("type") != "echo":
+                return False
+            rendered = d.get("rendered")
+            return self.echo(int(d["seq"]), float(d["received"]),
+                             None if rendered is None else float(rendered))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return False
+
+    def snapshot(self):
+        """
+        Returns:
+            dict of stage -> {"count", "p50", "p90", "p99", "max"} in ms, for
+            the stages with samples.
+        """
+        stats = {}
+        for stage, samples in self.samples.items():
+            if samples:
+                values = sorted(samples)
+                stats[stage] = {"count": len(values), "max": values[-1]}
+                for p in PERCENTILES:
+                    stats[stage][f"p{p}"] = percentile(values, p)
+        return stats
+
+
+def summary(snapshot):
+    """One line description of a snapshot() for logging."""
+    return ", ".join(f"{stage} p50 {s['p50']:.1f} p90 {s['p90']:.1f} p99 {s['p99']:.1f} max {s['max']:.1f} ms"
+                     for stage, s in snapshot.items()) or "no echoes"
@@ -0,0 +1,223 @@
+"""
+---- sniffer.shm ----
+Publishes projected frames in a multiprocessing.shared_memory ring buffer so
+processes on the same machine can read them without a websocket or JSON.
+
+Layout, all little endian:
+- HEADER_DTYPE at offset 0: magic, version, slot count, slot size and the
+  number of the last published frame (0 before the first one).
+- slot_count slots of FRAME_DTYPE starting at HEADER_SIZE. Frame n (counting
+  from 1) is written to slot (n - 1) % slot_count.
+
+Each slot's seq is a sequence lock: the writer sets it to 2n - 1 before
+writing frame n and to 2n when done. A reader holding a view of a slot knows
+the frame was complete and untouched if seq was 2n both before and after it
+used the data.
+
+Only numpy is needed to read, e.g.
+
+    reader = FrameRingReader("spacetime")
+    seq = reader.wait()
+    frame = reader.read()
+"""
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = b"SPTFRAME"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("slot_count", "<u4"),
+    ("slot_size", "<u4"),
+    ("reserved", "<u4"),
+    ("last", "<u8"),
+])
+HEADER_SIZE = 64
+
+FRAME_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("time", "<f8"),
+    ("has_projection", "<u8"),
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("yaw", "<f8"),
+    # lat, lon of corner0..corner3
+    ("corners", "<f8", (4, 2)),
+    # x, y offset of corner0..corner3
+    ("offsets", "<f8", (4, 2)),
+    # w, h
+    ("frame_size", "<f8", (2,)),
+])
+
+
+def _attach(name):
+    """Attach to an existing segment without the resource tracker unlinking it on exit."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the segment, unregister it again
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameRingWriter:
+    """
+    Creates the shared memory segment and publishes frames to it.
+
+    Args:
+        name: name of the segment, readers attach with the same name.
+        slot_count: number of frames kept, a reader that is more than this
+            many frames behind misses frames.
+    """
+
+    def __init__(self, name, slot_count=64):
+        if slot_count < 1:
+            raise ValueError("slot_count must be at least 1")
+        self.shm = shared_memory.SharedMemory(name, create=True,
+                                              size=HEADER_SIZE + slot_count*FRAME_DTYPE.itemsize)
+        self.name = name
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        self.slots = np.ndarray((slot_count,), dtype=FRAME_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.slots[:] = 0
+        self.header["magic"] = MAGIC
+        self.header["version"] = VERSION
+        self.header["slot_count"] = slot_count
+        self.header["slot_size"] = FRAME_DTYPE.itemsize
+        self.header["last"] = 0
+        self.last = 0
+
+    def publish(self, frame):
+        """
+        Publish a frame in the sniffer's websocket format.
+
+        Returns:
+            The number of the published frame.
+        """
+        n = self.last + 1
+        slot = self.slots[(n - 1) % len(self.slots)]
+        slot["seq"] = 2*n - 1
+        slot["time"] = time.time()
+        slot["lat"] = frame["lat"]
+        slot["lon"] = frame["lon"]
+        slot["yaw"] = frame["yaw"]
+        slot["has_projection"] = frame["has_projection"]
+        if frame["has_projection"]:
+            for i in range(4):
+                corner = frame[f"corner{i}"]
+                slot["corners"][i] = (corner["lat"], corner["lon"])
+                slot["offsets"][i] = (corner["offset"]["x"], corner["offset"]["y"])
+            slot["frame_size"] = (frame["frame_size"]["w"], frame["frame_size"]["h"])
+        else:
+            slot["corners"] = np.nan
+            slot["offsets"] = np.nan
+            slot["frame_size"] = np.nan
+        slot["seq"] = 2*n
+        self.header["last"] = n
+        self.last = n
+        return n
+
+    def close(self, unlink=True):
+        """Detach from the segment and by default remove it."""
+        # The numpy views must be released before the buffer can be closed
+        self.header = self.slots = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class FrameRingReader:
+    """
+    Attaches to a segment created by a FrameRingWriter.
+
+    view() returns frames without copying, check() tells if a viewed frame is
+    still intact. read() returns a consistent copy.
+    """
+
+    def __init__(self, name):
+        self.shm = _attach(name)
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        if self.header["magic"] != MAGIC or self.header["version"] != VERSION:
+            self.close()
+            raise ValueError(f"shared memory {name!r} does not hold version {VERSION} frames")
+        if self.header["slot_size"] != FRAME_DTYPE.itemsize:
+            self.close()
+            raise ValueError(f"shared memory {name!r} has an unexpected slot size")
+        self.slots = np.ndarray((int(self.header["slot_count"]),), dtype=FRAME_DTYPE,
+                                buffer=self.shm.buf, offset=HEADER_SIZE)
+
+    @property
+    def last(self):
+        """Number of the last published frame, 0 if there is none yet."""
+        return int(self.header["last"])
+
+    def view(self, n=None):
+        """
+        Zero copy view of frame n, by default the last one.
+
+        Returns:
+            A FRAME_DTYPE record backed by the shared memory, or None if frame n
+            is not published, is being written or has been overwritten. Call
+            check(n) when done with it to know it was not overwritten meanwhile.
+        """
+        if n is None:
+            n = self.last
+        if n < 1:
+            return None
+        slot = self.slots[(n - 1) % len(self.slots)]
+        if slot["seq"] != 2*n:
+            return None
+        return slot
+
+    def check(self, n):
+        """True if frame n is still complete in its slot."""
+        return n >= 1 and self.slots[(n - 1) % len(self.slots)]["seq"] == 2*n
+
+    def read(self, n=None, retries=100):
+        """
+        Copy of frame n, by default the last one.
+
+        Returns:
+            (n, FRAME_DTYPE record) or None if there is no such frame.
+        """
+        for _ in range(retries):
+            number = self.last if n is None else n
+            slot = self.view(number)
+            if slot is None:
+                if n is not None or number == 0:
+                    return None
+                # The last frame was overwritten while looking it up, retry
+                continue
+            frame = slot.copy()
+            if self.check(number):
+                return number, frame
+        return None
+
+    def wait(self, after=None, timeout=None, interval=0.0005):
+        """
+        Wait for a frame newer than after, by default the last one.
+
+        Returns:
+            The number of the newest frame, or None on timeout.
+        """
+        if after is None:
+            after = self.last
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            last = self.last
+            if last > after:
+                return last
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def close(self):
+        """Detach from the segment."""
+        self.header = self.slots = None
+        self.shm.close()
@@ -0,0 +1,143 @@
+import math
+
+# Bit order of the GIMBAL_DEVICE_FLAGS bitmap, least significant bit first
+GIMBAL_DEVICE_FLAGS = (
+    "GIMBAL_DEVICE_FLAGS_RETRACT",
+    "GIMBAL_DEVICE_FLAGS_NEUTRAL",
+    "GIMBAL_DEVICE_FLAGS_ROLL_LOCK",
+    "GIMBAL_DEVICE_FLAGS_PITCH_LOCK",
+    "GIMBAL_DEVICE_FLAGS_YAW_LOCK",
+    "GIMBAL_DEVICE_FLAGS_YAW_IN_VEHICLE_FRAME",
+    "GIMBAL_DEVICE_FLAGS_YAW_IN_EARTH_FRAME",
+    "GIMBAL_DEVICE_FLAGS_ACCEPTS_YAW_IN_EARTH_FRAME",
+    "GIMBAL_DEVICE_FLAGS_RC_EXCLUSIVE",
+    "GIMBAL_DEVICE_FLAGS_RC_MIXED",
+)
+
+#Standard value taken from MAVCesiums mount view
+DEFAULT_HORI_FOV = 109.17181489731475
+DEFAULT_VERT_FOV = 122.60000000000001
+
+
+def unpack_mavlink_flags(bitmap: int) -> dict:
+    """
+    Unpack a GIMBAL_DEVICE_FLAGS bitmap into a dict of flag name -> bool.
+    """
+    bitmap = int(bitmap)
+    return {flag: bool(bitmap >> i & 1) for i, flag in enumerate(GIMBAL_DEVICE_FLAGS)}
+
+
+def quat_to_euler(q):
+    """
+    Convert a scalar-first quaternion to (yaw, pitch, roll) in radians.
+
+    scipy is imported on first use so that importing the sniffer stays cheap.
+    """
+    from scipy.spatial.transform import Rotation as R
+    return R.from_quat(q, scalar_first=True).as_euler('zyx', degrees=False)
+
+
+class TelemetryState:
+    """
+    Latest known drone, gimbal and camera state, built up from MAVLink messages.
+
+    Call update() with each message dict and frame() to get the data sent to
+    the websocket clients.
+    """
+
+    def __init__(self):
+        #Set standard values
+        self.drone_pos = [0.0, 0.0, 1.0]
+        self.drone_angles = {'yaw': 0, 'pitch': 0, 'roll': 0}
+        self.cam_angles = {'yaw': 0, 'pitch': 0, 'roll': 0}
+        self.earth_frame = False
+        self.horiFOV = DEFAULT_HORI_FOV / 180 * math.pi
+        self.vertFOV = DEFAULT_VERT_FOV / 180 * math.pi
+        # Boot time (ms) and sender of the latest message, and Unix time (ms)
+        # of boot per sysid, from SYSTEM_TIME
+        self.time_boot_ms = None
+        self.sysid = None
+        self.boot_unix_ms = {}
+
+    def update(self, d, sysid=None):
+        """
+        Apply a MAVLink message, as given by to_dict(), from vehicle sysid to
+        the state.
+
+        Returns:
+            True if the message changed the projected state, else False.
+        """
+        msg_type = d["mavpackettype"]
+        if msg_type == "SYSTEM_TIME":
+            # time_unix_usec is 0 until the vehicle knows the time
+            if d["time_unix_usec"]:
+                self.boot_unix_ms[sysid] = d["time_unix_usec"]/1000 - d["time_boot_ms"]
+            return False
+        if msg_type == "GLOBAL_POSITION_INT":
+            self.drone_pos[0] = d["lat"]/(10**7)
+            self.drone_pos[1] = d["lon"]/(10**7)
+            self.drone_pos[2] = d["relative_alt"]/(10**3)
+        elif msg_type == "ATTITUDE":
+            self.drone_angles['yaw'] = d["yaw"]
+            self.drone_angles['pitch'] = d["pitch"]
+            self.drone_angles['roll'] = d["roll"]
+        elif msg_type == "GIMBAL_DEVICE_ATTITUDE_STATUS":
+            cam_rotation = quat_to_euler(d["q"])
+            self.cam_angles['yaw'] = cam_rotation[0]
+            self.cam_angles['pitch'] = cam_rotation[1]
+            self.cam_angles['roll'] = cam_rotation[2]
+            gimbal_flags = unpack_mavlink_flags(d["flags"])
+            if gimbal_flags["GIMBAL_DEVICE_FLAGS_YAW_IN_VEHICLE_FRAME"]:
+                self.earth_frame = False
+            elif gimbal_flags["GIMBAL_DEVICE_FLAGS_YAW_IN_EARTH_FRAME"]:
+                self.earth_frame = True
+            elif gimbal_flags["GIMBAL_DEVICE_FLAGS_YAW_LOCK"]:
+                self.earth_frame = True
+            else:
+                self.earth_frame = False
+        elif msg_type == "CAMERA_FOV_STATUS":
+            self.horiFOV = d["hfov"] / 180 * math.pi
+            self.vertFOV = d["vfov"] / 180 * math.pi
+        else:
+            return False
+        self.time_boot_ms = d.get("time_boot_ms")
+        self.sysid = sysid
+        return True
+
+    def source_time(self):
+        """
+        Unix time (ms) the vehicle sent the latest message at, None until both
+        a tracked message and a SYSTEM_TIME from its vehicle have been received.
+        """
+        boot_unix_ms = self.boot_unix_ms.get(self.sysid)
+        if self.time_boot_ms is None or boot_unix_ms is None:
+            return None
+        return boot_unix_ms + self.time_boot_ms
+
+    def frame(self):
+        """
+        Project the current camera FOV onto the ground.
+
+        Returns:
+            dict with the drone yaw and position, "has_projection" and, when a
+            projection exists, "corner0".."corner3" and "frame_size".
+        """
+        from projection import get_projection_points
+
+        data = {}
+        data["yaw"] = self.drone_angles['yaw']
+        data["lat"] = self.drone_pos[0]
+        data["lon"] = self.drone_pos[1]
+
+        fov_coords, corner_offset, frame_size = get_projection_points(
+            self.drone_pos, self.drone_angles, self.cam_angles,
+            self.horiFOV, self.vertFOV, self.earth_frame)
+        data["has_projection"] = False
+        if not fov_coords == math.inf:
+            data["has_projection"] = True
+            for i, corner in enumerate(fov_coords):
+                dict_corner = {"lat": float(corner[0]), "lon": float(corner[1]), "offset": {"x": float(corner_offset[i][0]), "y": float(corner_offset[i][1])}}
+                data[f"corner{i}"] = dict_corner
+
+            data["frame_size"] = frame_size
+        return data
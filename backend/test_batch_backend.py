@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from benchmarks import bench_projection
+from benchmarks.bench_projection import KINDS, evaluate, reference as reference_coords, sample_poses
+from projection import deg_to_rad, get_projection_points
+from projection_batch import MODE_TOLERANCES, PROJECTION_MODES, project_batch
+
+
+def random_poses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    drone_pos = np.c_[rng.uniform(-80, 80, n), rng.uniform(-180, 180, n), rng.uniform(10, 1000, n)]
+    drone_angles = np.c_[rng.uniform(-np.pi, np.pi, n), rng.uniform(-0.6, 0.6, n), rng.uniform(-0.6, 0.6, n)]
+    cam_angles = np.c_[rng.uniform(-np.pi, np.pi, n), rng.uniform(-np.pi/2, 0.3, n), rng.uniform(-0.3, 0.3, n)]
+    horiFOV = np.radians(rng.uniform(5, 130, n))
+    vertFOV = np.radians(rng.uniform(5, 130, n))
+    earth_frame = rng.random(n) < 0.3
+    return drone_pos, drone_angles, cam_angles, horiFOV, vertFOV, earth_frame
+
+
+def reference(drone_pos, drone_angles, cam_angles, horiFOV, vertFOV, earth_frame):
+    keys = ("yaw", "pitch", "roll")
+    return [get_projection_points(list(drone_pos[k]), dict(zip(keys, drone_angles[k])), dict(zip(keys, cam_angles[k])),
+                                  horiFOV[k], vertFOV[k], bool(earth_frame[k]))
+            for k in range(len(drone_pos))]
+
+
+@pytest.mark.parametrize("mode", PROJECTION_MODES)
+def test_project_batch_matches_reference(mode):
+    poses = random_poses(300)
+    fov_coords, corner_offset, frame_size, valid = project_batch(*poses, mode=mode)
+    expected = reference(*poses)
+    assert 0 < valid.sum() < len(valid)
+    for k, (coords, offset, size) in enumerate(expected):
+        if coords == np.inf:
+            assert not valid[k]
+            assert np.isnan(fov_coords[k]).all() and np.isnan(frame_size[k]).all()
+            continue
+        assert valid[k]
+        # 1e-7 degrees is about a centimetre
+        assert np.allclose(fov_coords[k], np.array(coords)[:, :2], rtol=0, atol=1e-7 if mode == "spherical" else 1e-12)
+        assert np.allclose(corner_offset[k], offset, rtol=0, atol=1e-12)
+        assert np.allclose(frame_size[k], [size["w"], size["h"]], rtol=0, atol=1e-12)
+
+
+def test_modes_within_tolerance():
+    # Every mode against the reference on random and edge case poses
+    poses, kinds = sample_poses(350, seed=1)
+    assert set(kinds) == set(KINDS)
+    expected = reference_coords(*poses)
+    results = evaluate(poses, kinds, expected, repeats=1)
+    assert set(results) == set(PROJECTION_MODES) == set(MODE_TOLERANCES)
+    for mode, result in results.items():
+        assert result["mismatches"] == 0, mode
+        assert result["nonfinite"] == 0, mode
+        assert result["max_error_m"] <= MODE_TOLERANCES[mode], mode
+        assert result["passed"]
+
+
+def test_evaluate_fails_non_finite_corners(monkeypatch):
+    poses, kinds = sample_poses(50, seed=2)
+    expected = reference_coords(*poses)
+    broken = {}
+
+    def project_broken(*args, mode):
+        # A mode that claims projections but returns NaN corners for the poses in broken
+        fov_coords, corner_offset, frame_size, valid = project_batch(*args, mode=mode)
+        fov_coords[broken["poses"]] = np.nan
+        return fov_coords, corner_offset, frame_size, valid
+
+    monkeypatch.setattr(bench_projection, "project_batch", project_broken)
+    projected = np.flatnonzero(expected[1])
+    for poses_broken in (projected[:1], projected):
+        broken["poses"] = poses_broken
+        result = evaluate(poses, kinds, expected, modes=["exact"], repeats=1)["exact"]
+        assert result["mismatches"] == 0
+        assert result["nonfinite"] == len(poses_broken)
+        assert not result["passed"]
+    assert result["max_error_m"] == 0.0 and result["worst_kind"] is None
+
+
+def test_project_batch_keeps_first_highest_corner():
+    # verify_FOV only lowers the corner that was highest at the start, so here
+    # it stops with another corner still above MIN_ANGLE_TO_XY
+    keys = ("yaw", "pitch", "roll")
+    drone_angles, cam_angles = [-0.2242, -0.3696, -0.4894], [-0.5391, 0.0849, 0.0765]
+    horiFOV, vertFOV = deg_to_rad(170), deg_to_rad(179)
+    coords, _, size = get_projection_points([68.7, 139.26, 7000.0], dict(zip(keys, drone_angles)),
+                                            dict(zip(keys, cam_angles)), horiFOV, vertFOV)
+    fov_coords, _, frame_size, valid = project_batch([[68.7, 139.26, 7000.0]], [drone_angles], [cam_angles],
+                                                     horiFOV, vertFOV)
+    assert valid[0]
+    assert np.allclose(fov_coords[0], np.array(coords)[:, :2], rtol=0, atol=1e-12)
+    assert np.allclose(frame_size[0], [size["w"], size["h"]], rtol=0, atol=1e-12)
+
+
+def test_project_batch_reduces_FOV():
+    # Camera looking 30 degrees below the horizon with a wide FOV must be cropped
+    angles = [0.0, deg_to_rad(-30), 0.0]
+    fov_coords, corner_offset, frame_size, valid = project_batch(
+        [[59.0, 18.0, 100.0]], [[0.0, 0.0, 0.0]], [angles], deg_to_rad(90), deg_to_rad(90))
+    assert valid[0]
+    assert frame_size[0, 1] < 1
+    assert np.allclose(frame_size[0, 0], 1)
+
+
+def test_project_batch_broadcasts_scalars():
+    fov_coords, _, _, valid = project_batch(
+        [[59.0, 18.0, 100.0]]*3, np.zeros((3, 3)), [[0.0, -np.pi/2 + 0.1, 0.0]]*3, deg_to_rad(60), deg_to_rad(40), True)
+    assert valid.all()
+    assert np.allclose(fov_coords[0], fov_coords[2])
+
+
+def test_project_batch_invalid_mode():
+    with pytest.raises(ValueError):
+        project_batch([[59.0, 18.0, 100.0]], np.zeros((1, 3)), np.zeros((1, 3)), 1.0, 1.0, mode="fast")
+
+
+def test_project_batch_empty():
+    fov_coords, corner_offset, frame_size, valid = project_batch(np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 3)), [], [])
+    assert fov_coords.shape == (0, 4, 2) and valid.shape == (0,)
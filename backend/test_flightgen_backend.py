@@ -0,0 +1,159 @@
+import asyncio
+import threading
+from collections import Counter
+
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation as R
+
+from flightgen import TRAJECTORIES, FlightGenerator, euler_to_quat
+from flightgen.server import serve, write_tlog
+from sniffer import TelemetryState
+from sniffer.handlers import load_mavutil
+
+
+def parse(packets):
+    mav = load_mavutil().mavlink.MAVLink(None)
+    mav.robust_parsing = True
+    return mav.parse_buffer(b"".join(buf for _, buf in packets)) or []
+
+
+def test_same_seed_same_stream():
+    a = list(FlightGenerator("turns", vehicles=2, seed=7, corrupt=0.1).packets(5))
+    b = list(FlightGenerator("turns", vehicles=2, seed=7, corrupt=0.1).packets(5))
+    c = list(FlightGenerator("turns", vehicles=2, seed=8, corrupt=0.1).packets(5))
+    assert a == b
+    assert a != c
+
+
+def test_packets_replay_from_start():
+    generator = FlightGenerator(seed=1)
+    assert list(generator.packets(2)) == list(generator.packets(2))
+
+
+@pytest.mark.parametrize("trajectory", sorted(TRAJECTORIES))
+def test_trajectories_are_projectable(trajectory):
+    msgs = parse(FlightGenerator(trajectory, seed=3).packets(10))
+    state = TelemetryState()
+    projected = 0
+    for msg in msgs:
+        state.update(msg.to_dict())
+        projected += state.frame()["has_projection"]
+    assert projected > len(msgs) / 2
+    assert 58 < state.drone_pos[0] < 59 and 15 < state.drone_pos[1] < 16
+
+
+def test_rates_and_vehicles():
+    packets = list(FlightGenerator(vehicles=3, rates={"ATTITUDE": 1000, "CAMERA_FOV_STATUS": 0}).packets(2))
+    times = [t for t, _ in packets]
+    assert times == sorted(times)
+    counts = Counter((msg.get_srcSystem(), msg.get_type()) for msg in parse(packets))
+    for sysid in (1, 2, 3):
+        assert counts[(sysid, "ATTITUDE")] == 2000
+        assert counts[(sysid, "GLOBAL_POSITION_INT")] == 20
+        assert counts[(sysid, "CAMERA_FOV_STATUS")] == 0
+
+
+def test_sequence_numbers_per_vehicle():
+    msgs = parse(FlightGenerator(vehicles=2).packets(10))
+    for sysid in (1, 2):
+        seqs = [msg.get_seq() for msg in msgs if msg.get_srcSystem() == sysid]
+        assert all((b - a) % 256 == 1 for a, b in zip(seqs, seqs[1:]))
+
+
+def test_corruption():
+    clean = parse(FlightGenerator(seed=2).packets(10))
+    corrupt = parse(FlightGenerator(seed=2, corrupt=0.2).packets(10))
+    assert not any(msg.get_type() == "BAD_DATA" for msg in clean)
+    assert any(msg.get_type() == "BAD_DATA" for msg in corrupt)
+    valid = [msg for msg in corrupt if msg.get_type() != "BAD_DATA"]
+    assert len(clean) * 0.6 < len(valid) < len(clean)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        FlightGenerator("hover")
+    with pytest.raises(ValueError):
+        FlightGenerator(rates={"NOT_A_MESSAGE": 1})
+    with pytest.raises(ValueError):
+        FlightGenerator(corrupt=2)
+
+
+def test_euler_to_quat_matches_sniffer():
+    for angles in [(0.3, -1.2, 0.1), (-2.0, 0.5, -0.4), (0, -np.pi/3, 0)]:
+        q = euler_to_quat(*angles)
+        assert np.allclose(R.from_quat(q, scalar_first=True).as_euler('zyx'), angles)
+
+
+def test_write_tlog(tmp_path):
+    path = tmp_path / "flight.tlog"
+    write_tlog(FlightGenerator(), path, 3)
+    mlog = load_mavutil().mavlink_connection(str(path))
+    msgs = []
+    while (msg := mlog.recv_match()) is not None:
+        msgs.append(msg)
+    assert len(msgs) == len(list(FlightGenerator().packets(3)))
+    assert msgs[0]._timestamp < msgs[-1]._timestamp
+
+
+def test_serve_tcp(free_port):
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(serve(FlightGenerator(), port, speed=0, duration=5))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        mavutil = load_mavutil()
+        msrc = mavutil.mavlink_connection(f"tcp:localhost:{port}", retries=20)
+        msgs = [msrc.recv_match(type="ATTITUDE", blocking=True, timeout=5) for _ in range(10)]
+        assert all(msg is not None for msg in msgs)
+        msrc.close()
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(timeout=5)
+        loop.close()
+
+
+def test_serve_shares_one_flight(free_port):
+    port = free_port()
+
+    async def connect():
+        for _ in range(100):
+            try:
+                return await asyncio.open_connection("127.0.0.1", port)
+            except OSError:
+                await asyncio.sleep(0.01)
+
+    async def collect(reader, data):
+        while chunk := await reader.read(65536):
+            data.extend(chunk)
+
+    async def run():
+        server = asyncio.ensure_future(serve(FlightGenerator(), port, host="127.0.0.1", speed=5))
+        first, late = bytearray(), bytearray()
+        # The writers are kept, dropping one closes its connection
+        first_reader, first_writer = await connect()
+        collectors = [asyncio.ensure_future(collect(first_reader, first))]
+        await asyncio.sleep(0.4)
+        late_reader, late_writer = await connect()
+        collectors.append(asyncio.ensure_future(collect(late_reader, late)))
+        await asyncio.sleep(0.4)
+        server.cancel()
+        await asyncio.gather(server, *collectors, return_exceptions=True)
+        first_writer.close()
+        late_writer.close()
+        return bytes(first), bytes(late)
+
+    first, late = asyncio.run(run())
+    # The late client joins the running flight instead of getting a replay from t=0
+    assert late and first.endswith(late)
+    boot_ms = [msg.time_boot_ms for msg in parse([(0, late)]) if msg.get_type() == "ATTITUDE"]
+    assert boot_ms[0] > 1000
+    assert boot_ms == sorted(boot_ms)
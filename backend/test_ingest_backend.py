@@ -0,0 +1,342 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from flightgen import FlightGenerator
+from flightgen.server import TLOG_EPOCH, serve
+from sniffer import ingest as ingest_module
+from sniffer.handlers import FrameHub
+from sniffer.ingest import Deduplicator, Ingest, parse_endpoint
+from sniffer.telemetry import TelemetryState
+
+
+async def collect(ingest, received, count, timeout=10):
+    """Run ingest until count messages are received or timeout."""
+    task = asyncio.ensure_future(ingest.run())
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(received) < count and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def feed_all(ingest, link, packets, now=0.0):
+    link.parser = ingest.new_parser()
+    for _, buf in packets:
+        ingest.feed(link, buf, now)
+
+
+def test_parse_endpoint():
+    assert parse_endpoint("tcp:localhost:5762", None).port == 5762
+    assert parse_endpoint("udpin:0.0.0.0:14550", None).listen
+    assert not parse_endpoint("udpout:10.0.0.2:14550", None).listen
+    assert parse_endpoint("tlog:/tmp/a:b.tlog", None).path == "/tmp/a:b.tlog"
+    for spec in ["tcp:localhost", "serial:/dev/ttyUSB0:57600", "tcp", "udpin:host:port"]:
+        with pytest.raises(ValueError):
+            parse_endpoint(spec, None)
+
+
+def test_deduplicator_window():
+    dedup = Deduplicator(window=1.0)
+    assert dedup.first_arrival("a", 0.0) is None
+    assert dedup.first_arrival("a", 0.5) == 0.0
+    assert dedup.first_arrival("b", 0.6) is None
+    assert dedup.first_arrival("a", 1.5) is None
+    assert len(dedup.seen) == 2
+
+
+def test_feed_deduplicates_across_links():
+    received = []
+    ingest = Ingest(["tcp:localhost:1", "tcp:localhost:2"], ["ATTITUDE"], received.append)
+    packets = list(FlightGenerator(vehicles=2).packets(2))
+    feed_all(ingest, ingest.links[0], packets, now=0.0)
+    feed_all(ingest, ingest.links[1], packets, now=0.25)
+    assert len(received) == 2 * 2 * 50
+
+    first, second = ingest.links[0].stats, ingest.links[1].stats
+    assert first.received == second.received == len(packets)
+    assert first.duplicates == 0 and second.duplicates == len(packets)
+    assert second.snapshot(0.25)["latency_ms"] == pytest.approx(250)
+    assert first.snapshot(0.25)["latency_ms"] == 0
+
+
+def test_feed_counts_loss_and_bad_data():
+    ingest = Ingest(["tcp:localhost:1"], None, None)
+    packets = list(FlightGenerator().packets(5))
+    dropped = {10, 20, 21, 30}
+    feed_all(ingest, ingest.links[0], [p for i, p in enumerate(packets) if i not in dropped])
+    assert ingest.links[0].stats.lost == len(dropped)
+
+    ingest = Ingest(["tcp:localhost:1"], None, None)
+    feed_all(ingest, ingest.links[0], FlightGenerator(corrupt=0.2).packets(5))
+    assert ingest.links[0].stats.bad > 0
+
+
+def test_tcp_links_merge_and_reconnect(monkeypatch, free_port):
+    monkeypatch.setattr(ingest_module, "BACKOFF_START", 0.05)
+    port = free_port()
+    generator = FlightGenerator(seed=4)
+    count = sum(1 for _ in generator.packets(1))
+
+    async def run():
+        # Every flight lasts one second, then the server hangs up and starts over
+        server = asyncio.ensure_future(serve(generator, port, host="127.0.0.1", speed=0, duration=1))
+        received = []
+        endpoints = [f"tcp:127.0.0.1:{port}", f"tcp:127.0.0.1:{port}"]
+        ingest = Ingest(endpoints, None, received.append)
+        await collect(ingest, received, count + 1)
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+        return ingest, received
+
+    ingest, received = asyncio.run(run())
+    assert len(received) > count
+    for link in ingest.links:
+        assert link.stats.connects >= 2
+        assert link.stats.lost == 0
+    assert sum(link.stats.duplicates for link in ingest.links) > 0
+
+
+def test_udpin_link(free_port):
+    port = free_port(socket.SOCK_DGRAM)
+    packets = list(FlightGenerator().packets(1))
+
+    async def run():
+        received = []
+        ingest = Ingest([f"udpin:127.0.0.1:{port}"], None, received.append)
+        task = asyncio.ensure_future(ingest.run())
+        await asyncio.sleep(0.1)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for _, buf in packets:
+                s.sendto(buf, ("127.0.0.1", port))
+        for _ in range(100):
+            if len(received) == len(packets):
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return ingest, received
+
+    ingest, received = asyncio.run(run())
+    assert len(received) == len(packets)
+    assert ingest.links[0].stats.connected is False
+
+
+def test_udpin_link_stays_bound_while_stale(monkeypatch, free_port):
+    monkeypatch.setattr(ingest_module, "STALE_TIMEOUT", 0.1)
+    monkeypatch.setattr(ingest_module, "UDP_TICK", 0.02)
+    port = free_port(socket.SOCK_DGRAM)
+    packets = list(FlightGenerator().packets(1))
+
+    async def run():
+        received = []
+        ingest = Ingest([f"udpin:127.0.0.1:{port}"], None, received.append)
+        stats = ingest.links[0].stats
+        task = asyncio.ensure_future(ingest.run())
+        await asyncio.sleep(0.3)
+        stale = stats.connected
+        # Sent right after going stale, must not be lost to a rebind
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for _, buf in packets:
+                s.sendto(buf, ("127.0.0.1", port))
+        for _ in range(100):
+            if len(received) == len(packets) and stats.connected:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return stale, stats, received
+
+    stale, stats, received = asyncio.run(run())
+    assert stale is False
+    assert len(received) == len(packets)
+    assert stats.connects == 2
+
+
+def test_tcp_link_detects_silent_connection(monkeypatch, free_port):
+    monkeypatch.setattr(ingest_module, "STALE_TIMEOUT", 0.1)
+    monkeypatch.setattr(ingest_module, "BACKOFF_START", 0.05)
+    port = free_port()
+
+    async def run():
+        connections = []
+
+        async def silent(reader, writer):
+            # Keeps the connection open without sending anything, like a half-open link
+            connections.append(writer)
+            await asyncio.sleep(10)
+
+        server = await asyncio.start_server(silent, "127.0.0.1", port)
+        ingest = Ingest([f"tcp:127.0.0.1:{port}"], None, None)
+        task = asyncio.ensure_future(ingest.run())
+        for _ in range(100):
+            if ingest.links[0].stats.connects >= 2:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        for writer in connections:
+            writer.close()
+        server.close()
+        return ingest.links[0].stats
+
+    assert asyncio.run(run()).connects >= 2
+
+
+def test_unexpected_link_error_keeps_other_links_running(monkeypatch, caplog):
+    monkeypatch.setattr(ingest_module, "BACKOFF_START", 0.01)
+    sessions = []
+
+    async def broken(self):
+        sessions.append(self.spec)
+        raise AttributeError("bug in the link")
+
+    monkeypatch.setattr(ingest_module.TcpLink, "session", broken)
+
+    async def run():
+        ingest = Ingest(["tcp:localhost:1", "tlog:/does/not/exist"], None, None)
+        task = asyncio.ensure_future(ingest.run())
+        await asyncio.sleep(0.2)
+        running = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return running
+
+    assert asyncio.run(run())
+    # The broken link keeps retrying with backoff
+    assert len(sessions) >= 2
+    assert "tcp:localhost:1: unexpected error" in caplog.text
+
+
+def test_failing_message_handler_keeps_ingest_running(caplog, free_port):
+    from pymavlink.dialects.v20 import common as mavlink2
+
+    port = free_port(socket.SOCK_DGRAM)
+    mav = mavlink2.MAVLink(None, srcSystem=1, srcComponent=1)
+    # A zero quaternion makes scipy raise in TelemetryState.update
+    bad = bytes(mav.gimbal_device_attitude_status_encode(0, 0, 0, 0, [0, 0, 0, 0], 0, 0, 0, 0).pack(mav))
+    mav.seq += 1
+    good = bytes(mav.attitude_encode(1000, 0.0, 0.0, 0.5, 0, 0, 0).pack(mav))
+    state = TelemetryState()
+
+    async def run():
+        ingest = Ingest([f"udpin:127.0.0.1:{port}"], None, lambda msg: state.update(msg.to_dict()))
+        task = asyncio.ensure_future(ingest.run())
+        await asyncio.sleep(0.1)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.sendto(bad, ("127.0.0.1", port))
+            s.sendto(good, ("127.0.0.1", port))
+        for _ in range(100):
+            if state.drone_angles["yaw"] == 0.5:
+                break
+            await asyncio.sleep(0.01)
+        running = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return running
+
+    assert asyncio.run(run())
+    assert state.drone_angles["yaw"] == 0.5
+    assert "handling GIMBAL_DEVICE_ATTITUDE_STATUS failed" in caplog.text
+
+
+def test_tlog_link_follows_appended_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_module, "TLOG_POLL", 0.01)
+    path = tmp_path / "live.tlog"
+    packets = list(FlightGenerator().packets(2))
+    old, new = packets[:50], packets[50:]
+
+    def record(t, buf):
+        return struct.pack(">Q", round((TLOG_EPOCH + t)*1e6)) + buf
+
+    path.write_bytes(b"".join(record(t, buf) for t, buf in old))
+
+    async def run():
+        received = []
+        ingest = Ingest([f"tlog:{path}"], None, received.append)
+        task = asyncio.ensure_future(ingest.run())
+        await asyncio.sleep(0.05)
+        with open(path, "ab") as f:
+            for t, buf in new:
+                # Write records in two halves to exercise partial reads
+                data = record(t, buf)
+                f.write(data[:7])
+                f.flush()
+                await asyncio.sleep(0)
+                f.write(data[7:])
+                f.flush()
+        for _ in range(200):
+            if len(received) == len(new):
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return received
+
+    received = asyncio.run(run())
+    assert [bytes(msg.get_msgbuf()) for msg in received] == [buf for _, buf in new]
+
+
+def test_tlog_link_yields_while_file_grows(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_module, "TLOG_POLL", 0.01)
+    path = tmp_path / "busy.tlog"
+    path.write_bytes(b"")
+    record = struct.pack(">Q", TLOG_EPOCH*10**6) + next(iter(FlightGenerator().packets(1)))[1]
+    ticks = {"count": 0, "while_reading": None}
+
+    class GrowingFile:
+        """A .tlog with another record on each of the first 1000 reads."""
+
+        def __init__(self, f):
+            self.f = f
+            self.reads = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+
+        def __getattr__(self, name):
+            return getattr(self.f, name)
+
+        def read(self):
+            self.reads += 1
+            if self.reads == 1000:
+                ticks["while_reading"] = ticks["count"]
+            return record if self.reads < 1000 else b""
+
+    monkeypatch.setattr(ingest_module, "open", lambda *args: GrowingFile(open(*args)), raising=False)
+
+    async def run():
+        ingest = Ingest([f"tlog:{path}"], None, None)
+        task = asyncio.ensure_future(ingest.run())
+        while ticks["while_reading"] is None:
+            await asyncio.sleep(0.001)
+            ticks["count"] += 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return ingest.links[0].stats.received
+
+    assert asyncio.run(run()) == 999
+    # The other tasks kept running while the records were read
+    assert ticks["while_reading"] > 1
+
+
+def test_frame_hub_drops_oldest():
+    async def run():
+        hub = FrameHub(maxsize=2)
+        queue = hub.subscribe()
+        for frame in ["a", "b", "c"]:
+            hub.publish(frame)
+        frames = [queue.get_nowait(), queue.get_nowait()]
+        hub.unsubscribe(queue)
+        hub.publish("d")
+        return frames, queue.empty()
+
+    assert asyncio.run(run()) == (["b", "c"], True)
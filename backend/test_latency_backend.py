@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import pytest
+import websockets
+
+from flightgen import FlightGenerator
+from flightgen.server import serve as serve_flight
+from sniffer.handlers import FrameHub, framesender
+from sniffer.ingest import Ingest
+from sniffer.latency import LatencyStats, now_ms, percentile, summary
+from sniffer.telemetry import TelemetryState
+
+
+def timing(seq):
+    return {"seq": seq, "source": 1000.0, "ingest": 1010.0, "projected": 1012.0, "sent": 1013.0}
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 50) == 7
+
+
+def test_latency_stages():
+    stats = LatencyStats()
+    for seq in range(1, 101):
+        stats.sent(timing(seq))
+        assert stats.echo(seq, 1015.0, 1015.0 + seq)
+    snapshot = stats.snapshot()
+    assert snapshot["link"] == {"count": 100, "max": 10, "p50": 10, "p90": 10, "p99": 10}
+    assert snapshot["network"]["p50"] == 2
+    assert snapshot["render"]["p50"] == 50 and snapshot["render"]["max"] == 100
+    assert snapshot["glass_to_glass"]["p90"] == 105
+    assert "p99 114.0" in summary(snapshot)
+
+
+def test_latency_without_source_or_render_time():
+    stats = LatencyStats()
+    stats.sent(dict(timing(1), source=None))
+    stats.echo(1, 1020.0)
+    snapshot = stats.snapshot()
+    assert set(snapshot) == {"projection", "queue", "network"}
+
+
+def test_latency_ignores_unknown_frames_and_bad_messages():
+    stats = LatencyStats(pending=2)
+    for seq in range(1, 4):
+        stats.sent(timing(seq))
+    # Frame 1 was forgotten, frame 3 can only be echoed once
+    assert not stats.echo(1, 1020.0)
+    assert stats.handle(json.dumps({"type": "echo", "seq": 3, "received": 1020.0}))
+    assert not stats.handle(json.dumps({"type": "echo", "seq": 3, "received": 1020.0}))
+    for message in ("not json", "[]", '{"type": "echo"}', '{"type": "echo", "seq": 2, "received": "soon"}', '{"type": "hello"}'):
+        assert not stats.handle(message)
+    assert stats.echoes == 1
+    assert stats.unknown == 2
+
+
+def test_framesender_aggregates_echoes_per_client(free_port):
+    port = free_port()
+    hub = FrameHub()
+
+    async def client(rendered_after):
+        async with websockets.connect(f"ws://localhost:{port}") as ws:
+            for _ in range(10):
+                frame = json.loads(await asyncio.wait_for(ws.recv(), 5))
+                t = frame["timing"]
+                await ws.send(json.dumps({"type": "echo", "seq": t["seq"],
+                                          "received": t["sent"] + 1, "rendered": t["sent"] + 1 + rendered_after}))
+            # Wait for the echoes to be handled before disconnecting
+            for _ in range(100):
+                if sum(latency.echoes for latency in hub.latency.values()) == 20:
+                    return {name: latency.snapshot() for name, latency in hub.latency.items()}
+                await asyncio.sleep(0.01)
+
+    async def publisher():
+        for seq in range(1, 1000):
+            hub.publish({"lat": 58.0, "timing": timing(seq)})
+            await asyncio.sleep(0.005)
+
+    async def run():
+        async with websockets.serve(lambda ws: framesender(ws, hub), "localhost", port):
+            task = asyncio.ensure_future(publisher())
+            results = await asyncio.gather(client(5), client(50))
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            # Disconnected clients are removed
+            for _ in range(100):
+                if not hub.latency:
+                    break
+                await asyncio.sleep(0.01)
+            return results, dict(hub.latency)
+
+    (snapshots, _), remaining = asyncio.run(run())
+    assert remaining == {}
+    assert len(snapshots) == 2
+    renders = sorted(snapshot["render"]["p50"] for snapshot in snapshots.values())
+    assert renders == [pytest.approx(5), pytest.approx(50)]
+    for snapshot in snapshots.values():
+        assert snapshot["glass_to_glass"]["count"] == 10
+        assert snapshot["link"]["max"] == 10
+
+
+def test_flightgen_link_latency_after_late_connect(free_port):
+    port = free_port()
+    state = TelemetryState()
+    latencies = []
+
+    def on_message(msg):
+        if state.update(msg.to_dict(), msg.get_srcSystem()) and state.source_time() is not None:
+            latencies.append(now_ms() - state.source_time())
+
+    async def run():
+        flight = asyncio.ensure_future(serve_flight(FlightGenerator(vehicles=2), port, host="127.0.0.1"))
+        # Connecting a while after the flight started must not add to the latency
+        await asyncio.sleep(1)
+        ingest = Ingest([f"tcp:127.0.0.1:{port}"], None, on_message)
+        task = asyncio.ensure_future(ingest.run())
+        for _ in range(300):
+            if len(latencies) >= 50:
+                break
+            await asyncio.sleep(0.01)
+        for t in (task, flight):
+            t.cancel()
+        await asyncio.gather(task, flight, return_exceptions=True)
+
+    asyncio.run(run())
+    assert len(latencies) >= 50
+    assert -50 < min(latencies) and max(latencies) < 200
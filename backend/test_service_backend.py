@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+import pytest
+
+from projection_service import POSE_COLUMNS, RESULT_COLUMNS, create_app
+import projection_service
+
+DOWN = {"lat": 59.0, "lon": 18.0, "alt": 100.0, "cam_pitch": -60, "hfov": 60, "vfov": 40}
+UP = {"lat": 59.0, "lon": 18.0, "alt": 100.0, "cam_pitch": 60, "hfov": 60, "vfov": 40}
+
+
+@pytest.fixture
+def client():
+    return create_app(workers=2, max_poses=10_000, max_requests=2).test_client()
+
+
+def as_row(pose):
+    return [float(pose.get(key, 0)) for key in POSE_COLUMNS]
+
+
+def test_project_json(client):
+    response = client.post("/project", json={"poses": [DOWN, UP]})
+    assert response.status_code == 200
+    down, up = response.get_json()["results"]
+    assert down["has_projection"] and not up["has_projection"]
+    assert set(down) == {"has_projection", "corner0", "corner1", "corner2", "corner3", "frame_size"}
+    assert 58.9 < down["corner0"]["lat"] < 59.1
+    assert set(down["corner0"]["offset"]) == {"x", "y"}
+
+
+def test_project_binary_matches_json(client):
+    poses = [DOWN, UP, dict(DOWN, yaw=45, earth_frame=1)]
+    body = np.array([as_row(pose) for pose in poses], dtype="<f8").tobytes()
+    response = client.post("/project", data=body, content_type="application/octet-stream")
+    assert response.status_code == 200
+    results = np.frombuffer(response.data, dtype="<f8").reshape(-1, len(RESULT_COLUMNS))
+    assert results.shape == (3, 19)
+    assert list(results[:, 0]) == [1, 0, 1]
+    assert np.isnan(results[1, 1:]).all()
+
+    frames = client.post("/project", json={"poses": poses}).get_json()["results"]
+    assert results[0, RESULT_COLUMNS.index("corner2_lon")] == frames[0]["corner2"]["lon"]
+    assert results[2, RESULT_COLUMNS.index("h")] == frames[2]["frame_size"]["h"]
+
+
+def test_project_stream(client, monkeypatch):
+    monkeypatch.setattr(projection_service, "CHUNK_SIZE", 7)
+    poses = [dict(DOWN, yaw=i) for i in range(50)]
+    response = client.post("/project?stream=1", json={"poses": poses})
+    assert response.mimetype == "application/x-ndjson"
+    streamed = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert streamed == client.post("/project", json={"poses": poses}).get_json()["results"]
+
+    body = np.array([as_row(pose) for pose in poses], dtype="<f8").tobytes()
+    response = client.post("/project?stream=1&mode=spherical", data=body, content_type="application/octet-stream")
+    assert len(response.data) == 50*len(RESULT_COLUMNS)*8
+
+
+def test_project_bad_requests(client):
+    assert client.post("/project", json={"pose": []}).status_code == 400
+    assert client.post("/project", json={"poses": [{"lat": 1}]}).status_code == 400
+    assert client.post("/project", json={"poses": [dict(DOWN, alt="high")]}).status_code == 400
+    assert client.post("/project?mode=fast", json={"poses": [DOWN]}).status_code == 400
+    assert client.post("/project", data=b"\0"*10, content_type="application/octet-stream").status_code == 400
+    response = client.post("/project", data=b"{not json", content_type="application/json")
+    assert response.status_code == 400 and "error" in response.get_json()
+
+
+@pytest.mark.parametrize("bad", [{"lat": 95}, {"lat": -90.5}, {"alt": 0}, {"alt": -10}, {"hfov": 0},
+                                 {"hfov": -60}, {"hfov": 400}, {"vfov": 180}])
+def test_project_out_of_range(client, bad):
+    response = client.post("/project", json={"poses": [DOWN, dict(DOWN, **bad)]})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith(f"pose 1: {next(iter(bad))}")
+    body = np.array([as_row(DOWN), as_row(dict(DOWN, **bad))], dtype="<f8").tobytes()
+    assert client.post("/project", data=body, content_type="application/octet-stream").status_code == 400
+
+
+def test_project_json_has_no_nan(client):
+    poses = [dict(DOWN, lat=90), dict(DOWN, lat=-90, hfov=179.9, vfov=0.1), UP]
+    response = client.post("/project", json={"poses": poses})
+    assert response.status_code == 200
+    assert b"NaN" not in response.data
+    # A row the engine could not fully project is reported without a projection
+    row = np.zeros(len(RESULT_COLUMNS))
+    row[0], row[5] = 1, np.nan
+    assert projection_service.results_to_json(row[None]) == [{"has_projection": False}]
+
+
+def test_project_limits(client):
+    body = np.zeros((10_001, len(POSE_COLUMNS)), dtype="<f8").tobytes()
+    response = client.post("/project", data=body, content_type="application/octet-stream")
+    assert response.status_code == 413
+    response = client.post("/project", data=b"\0"*(10_000*512 + 1), content_type="application/octet-stream")
+    assert response.status_code == 413
+
+
+def test_project_busy():
+    app = create_app(workers=1, max_requests=1)
+    client = app.test_client()
+    # An unread streaming response keeps its slot
+    streaming = client.post("/project?stream=1", json={"poses": [DOWN]}, buffered=False)
+    assert client.post("/project", json={"poses": [DOWN]}).status_code == 503
+    streaming.close()
+    assert client.post("/project", json={"poses": [DOWN]}).status_code == 200
@@ -0,0 +1,158 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from flightgen import FlightGenerator
+from flightgen.server import serve as serve_flight
+from sniffer import TelemetryState, build_parser
+from sniffer.cli import serve
+from sniffer.shm import FrameRingReader, FrameRingWriter
+
+
+@pytest.fixture
+def name():
+    return f"spacetime-test-{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def writer(name):
+    writer = FrameRingWriter(name, slot_count=4)
+    yield writer
+    writer.close()
+
+
+def projected_frame():
+    state = TelemetryState()
+    state.update({"mavpackettype": "GLOBAL_POSITION_INT", "lat": 590000000, "lon": 180000000, "relative_alt": 100000})
+    # Gimbal pitched 60 degrees down
+    state.update({"mavpackettype": "GIMBAL_DEVICE_ATTITUDE_STATUS", "q": [np.cos(-np.pi/6), 0, np.sin(-np.pi/6), 0], "flags": 0})
+    return state.frame()
+
+
+def test_read_published_frame(writer, name):
+    frame = projected_frame()
+    reader = FrameRingReader(name)
+    assert reader.last == 0
+    assert reader.read() is None
+
+    assert writer.publish(frame) == 1
+    n, record = reader.read()
+    assert n == 1
+    assert record["has_projection"]
+    assert (record["lat"], record["lon"]) == (59.0, 18.0)
+    for i in range(4):
+        assert tuple(record["corners"][i]) == (frame[f"corner{i}"]["lat"], frame[f"corner{i}"]["lon"])
+        assert tuple(record["offsets"][i]) == (frame[f"corner{i}"]["offset"]["x"], frame[f"corner{i}"]["offset"]["y"])
+    assert tuple(record["frame_size"]) == (frame["frame_size"]["w"], frame["frame_size"]["h"])
+    reader.close()
+
+
+def test_frame_without_projection(writer, name):
+    writer.publish({"yaw": 0.0, "lat": 1.0, "lon": 2.0, "has_projection": False})
+    reader = FrameRingReader(name)
+    _, record = reader.read()
+    assert not record["has_projection"]
+    assert np.isnan(record["corners"]).all() and np.isnan(record["frame_size"]).all()
+    reader.close()
+
+
+def test_view_is_zero_copy_and_checked(writer, name):
+    reader = FrameRingReader(name)
+    writer.publish(projected_frame())
+    view = reader.view(1)
+    assert np.shares_memory(view, reader.slots)
+    assert reader.check(1)
+
+    # Frame 5 overwrites frame 1 in a ring of 4
+    for _ in range(4):
+        writer.publish(projected_frame())
+    assert not reader.check(1)
+    assert reader.view(1) is None
+    assert reader.read(1) is None
+    assert reader.read()[0] == 5
+    reader.close()
+
+
+def test_frame_being_written_is_not_returned(writer, name):
+    reader = FrameRingReader(name)
+    writer.publish(projected_frame())
+    # What a reader sees while the writer is in the middle of frame 1
+    writer.slots[0]["seq"] = 1
+    assert reader.view(1) is None
+    assert not reader.check(1)
+    assert reader.read(1) is None
+    reader.close()
+
+
+def test_wait(writer, name):
+    reader = FrameRingReader(name)
+    assert reader.wait(timeout=0.01) is None
+
+    timer = threading.Timer(0.05, writer.publish, [projected_frame()])
+    timer.start()
+    assert reader.wait(timeout=5) == 1
+    timer.join()
+    assert reader.wait(after=0, timeout=0) == 1
+    reader.close()
+
+
+def test_reader_in_other_process(writer, name):
+    writer.publish(projected_frame())
+    code = ("import sys; from sniffer.shm import FrameRingReader;"
+            "reader = FrameRingReader(sys.argv[1]); n, frame = reader.read();"
+            "print(n, frame['lat'], frame['lon']); reader.close()")
+    for _ in range(2):
+        # The segment must survive a reader exiting
+        result = subprocess.run([sys.executable, "-c", code, name], capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ["1", "59.0", "18.0"]
+        assert "leaked" not in result.stderr
+
+
+def test_reader_rejects_other_segments(name):
+    shm = shared_memory.SharedMemory(name, create=True, size=4096)
+    try:
+        with pytest.raises(ValueError):
+            FrameRingReader(name)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_serve_publishes_to_shared_memory(name, free_port):
+    mavlink_port, websocket_port = free_port(), free_port()
+    args = build_parser().parse_args(["-e", f"tcp:127.0.0.1:{mavlink_port}", "-w", str(websocket_port),
+                                      "--shm", name, "--shm-slots", "8"])
+
+    async def run():
+        flight = asyncio.ensure_future(serve_flight(FlightGenerator(), mavlink_port, host="127.0.0.1"))
+        sniffer = asyncio.ensure_future(serve(args))
+        try:
+            reader = None
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                try:
+                    reader = reader or FrameRingReader(name)
+                except FileNotFoundError:
+                    continue
+                if reader.last >= 30:
+                    break
+            n, frame = reader.read()
+            reader.close()
+            return n, frame
+        finally:
+            for task in (flight, sniffer):
+                task.cancel()
+            await asyncio.gather(flight, sniffer, return_exceptions=True)
+
+    n, frame = asyncio.run(run())
+    assert n >= 30
+    assert 58 < frame["lat"] < 59
+    # The sniffer removes the segment when it stops
+    with pytest.raises(FileNotFoundError):
+        FrameRingReader(name)
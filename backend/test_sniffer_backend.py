@@ -0,0 +1,153 @@
+import asyncio
+import json
+import subprocess
+import sys
+
+import numpy as np
+import websockets
+
+from flightgen import FlightGenerator
+from flightgen.server import serve as serve_flight
+from sniffer import DEFAULT_MESSAGES, TelemetryState, build_parser, unpack_mavlink_flags
+from sniffer.cli import ingest_messages, serve
+
+
+def test_import_has_no_heavy_dependencies():
+    # Importing the package must not parse arguments or pull in the heavy modules
+    code = ("import sys, sniffer, mavlink_sniffer;"
+            "heavy = [m for m in ('scipy', 'pyproj', 'pymavlink', 'websockets', 'projection') if m in sys.modules];"
+            "print(','.join(heavy))")
+    result = subprocess.run([sys.executable, "-c", code, "--not-an-argument"],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_parser_defaults():
+    args = build_parser().parse_args([])
+    assert args.port == 5762
+    assert args.websocket_port == 8777
+    assert args.messages == DEFAULT_MESSAGES
+    assert args.path is None
+
+
+def test_parser_arguments():
+    args = build_parser().parse_args(["-p", "1234", "-w", "4321", "-m", "ATTITUDE", "-f", "log.tlog"])
+    assert args.port == 1234
+    assert args.websocket_port == 4321
+    assert args.messages == ["ATTITUDE"]
+    assert args.path == "log.tlog"
+
+
+def test_only_live_links_ingest_system_time():
+    # The .tlog replay sends every filtered message, so SYSTEM_TIME is not a default
+    assert "SYSTEM_TIME" not in DEFAULT_MESSAGES
+    assert ingest_messages(DEFAULT_MESSAGES) == DEFAULT_MESSAGES + ["SYSTEM_TIME"]
+    assert ingest_messages(["SYSTEM_TIME", "ATTITUDE"]) == ["SYSTEM_TIME", "ATTITUDE"]
+
+
+def test_unpack_mavlink_flags():
+    flags = unpack_mavlink_flags(0b1010000)
+    assert flags["GIMBAL_DEVICE_FLAGS_YAW_LOCK"]
+    assert flags["GIMBAL_DEVICE_FLAGS_YAW_IN_EARTH_FRAME"]
+    assert not flags["GIMBAL_DEVICE_FLAGS_RETRACT"]
+    assert not flags["GIMBAL_DEVICE_FLAGS_RC_MIXED"]
+    assert len(flags) == 10
+
+
+def test_telemetry_state_update():
+    state = TelemetryState()
+    assert state.update({"mavpackettype": "GLOBAL_POSITION_INT", "lat": 590000000, "lon": 180000000, "relative_alt": 100000})
+    assert state.update({"mavpackettype": "ATTITUDE", "yaw": 0.5, "pitch": 0.1, "roll": -0.1})
+    assert state.update({"mavpackettype": "CAMERA_FOV_STATUS", "hfov": 60, "vfov": 40})
+    assert not state.update({"mavpackettype": "HEARTBEAT"})
+    assert state.drone_pos == [59.0, 18.0, 100.0]
+    assert state.drone_angles == {"yaw": 0.5, "pitch": 0.1, "roll": -0.1}
+    assert np.isclose(state.horiFOV, np.pi/3)
+
+
+def test_telemetry_state_gimbal_earth_frame():
+    state = TelemetryState()
+    # Identity quaternion with only the yaw in earth frame flag set
+    state.update({"mavpackettype": "GIMBAL_DEVICE_ATTITUDE_STATUS", "q": [1, 0, 0, 0], "flags": 1 << 6})
+    assert state.earth_frame
+    assert np.allclose([state.cam_angles[k] for k in ("yaw", "pitch", "roll")], 0)
+    state.update({"mavpackettype": "GIMBAL_DEVICE_ATTITUDE_STATUS", "q": [1, 0, 0, 0], "flags": 1 << 5})
+    assert not state.earth_frame
+
+
+def test_telemetry_state_source_time():
+    state = TelemetryState()
+    assert not state.update({"mavpackettype": "SYSTEM_TIME", "time_unix_usec": 1_700_000_000_000_000, "time_boot_ms": 1000})
+    assert state.source_time() is None
+    state.update({"mavpackettype": "ATTITUDE", "time_boot_ms": 1500, "yaw": 0, "pitch": 0, "roll": 0})
+    assert state.source_time() == 1_700_000_000_500
+    # A vehicle without a time source sends 0
+    state.update({"mavpackettype": "SYSTEM_TIME", "time_unix_usec": 0, "time_boot_ms": 2000})
+    assert state.source_time() == 1_700_000_000_500
+
+
+def test_telemetry_state_source_time_per_vehicle():
+    state = TelemetryState()
+    state.update({"mavpackettype": "SYSTEM_TIME", "time_unix_usec": 1_700_000_000_000_000, "time_boot_ms": 1000}, 1)
+    state.update({"mavpackettype": "SYSTEM_TIME", "time_unix_usec": 1_700_000_060_000_000, "time_boot_ms": 1000}, 2)
+    state.update({"mavpackettype": "ATTITUDE", "time_boot_ms": 1500, "yaw": 0, "pitch": 0, "roll": 0}, 2)
+    assert state.source_time() == 1_700_000_060_500
+    state.update({"mavpackettype": "ATTITUDE", "time_boot_ms": 1500, "yaw": 0, "pitch": 0, "roll": 0}, 1)
+    assert state.source_time() == 1_700_000_000_500
+    # Vehicle 3 has not sent SYSTEM_TIME, another vehicle's must not be used
+    state.update({"mavpackettype": "ATTITUDE", "time_boot_ms": 1500, "yaw": 0, "pitch": 0, "roll": 0}, 3)
+    assert state.source_time() is None
+
+
+def test_telemetry_state_frame():
+    state = TelemetryState()
+    state.update({"mavpackettype": "GLOBAL_POSITION_INT", "lat": 590000000, "lon": 180000000, "relative_alt": 100000})
+    # Gimbal pitched 60 degrees down
+    state.update({"mavpackettype": "GIMBAL_DEVICE_ATTITUDE_STATUS", "q": [np.cos(-np.pi/6), 0, np.sin(-np.pi/6), 0], "flags": 0})
+    data = state.frame()
+    assert data["has_projection"]
+    assert data["lat"] == 59.0 and data["lon"] == 18.0
+    for i in range(4):
+        assert set(data[f"corner{i}"]) == {"lat", "lon", "offset"}
+    assert 0 <= data["frame_size"]["w"] <= 1
+
+
+def test_telemetry_state_frame_without_projection():
+    # Gimbal pitched 60 degrees up
+    state = TelemetryState()
+    state.update({"mavpackettype": "GIMBAL_DEVICE_ATTITUDE_STATUS", "q": [np.cos(np.pi/6), 0, np.sin(np.pi/6), 0], "flags": 0})
+    data = state.frame()
+    assert not data["has_projection"]
+    assert "corner0" not in data
+
+
+def test_serve_sends_frames_from_endpoints(free_port):
+    mavlink_port, websocket_port = free_port(), free_port()
+    args = build_parser().parse_args(["-e", f"tcp:127.0.0.1:{mavlink_port}", "-w", str(websocket_port)])
+
+    async def run():
+        flight = asyncio.ensure_future(serve_flight(FlightGenerator(), mavlink_port, host="127.0.0.1"))
+        sniffer = asyncio.ensure_future(serve(args))
+        try:
+            for _ in range(100):
+                try:
+                    async with websockets.connect(f"ws://localhost:{websocket_port}") as ws:
+                        # About 1.5 s of flight, enough for its first SYSTEM_TIME
+                        return [json.loads(await asyncio.wait_for(ws.recv(), 5)) for _ in range(120)]
+                except OSError:
+                    await asyncio.sleep(0.05)
+        finally:
+            for task in (flight, sniffer):
+                task.cancel()
+            await asyncio.gather(flight, sniffer, return_exceptions=True)
+
+    frames = asyncio.run(run())
+    assert len(frames) == 120
+    assert all("has_projection" in frame for frame in frames)
+    assert 58 < frames[-1]["lat"] < 59
+    # flightgen sends SYSTEM_TIME, so the frames can be traced back to the vehicle
+    timing = frames[-1]["timing"]
+    assert timing["seq"] > frames[0]["timing"]["seq"]
+    assert timing["source"] is not None
+    assert timing["ingest"] <= timing["projected"] <= timing["sent"]
+    assert 0 <= timing["ingest"] - timing["source"] < 1000
@@ -5,6 +5,8 @@ from pytest_mock import mocker
 
 def test_dist_to_degs_new(mocker):
     mock_geod = mocker.patch("projection.Geod")
+    # Drop the shared instances so the mock is used
+    mocker.patch.dict("projection._geods", clear=True)
     instance = mock_geod.return_value
     instance.fwd.side_effect = [
         (10.1, 59.1, 0),
@@ -36,6 +36,17 @@ const rasterLayer = (id: string): LayerProps => ({
   beforeId: "projLayer",
 });
 
+/**
+ * Whether to echo receive and render times of each frame to the sniffer,
+ * which aggregates them into latency percentiles. Enabled with ?latency.
+ */
+const ECHO_LATENCY = new URLSearchParams(window.location.search).has("latency");
+
+/**
+ * Unix time in ms, the clock the sniffer's frame timings use.
+ */
+const nowMs = () => performance.timeOrigin + performance.now();
+
 function App() {
   const videoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
@@ -240,6 +251,7 @@ function App() {
     const socket = new WebSocket("ws://localhost:8777");
 
     socket.onmessage = (event) => {
+      const received = nowMs();
       const json = JSON.parse(event.data);
       projectingRef.current = json.has_projection;
 
@@ -274,6 +286,21 @@ function App() {
           h: json.frame_size.h,
         });
       }
+
+      if (ECHO_LATENCY && json.timing) {
+        // The next animation frame is the first one that can show this frame
+        requestAnimationFrame(() => {
+          if (socket.readyState !== WebSocket.OPEN) return;
+          socket.send(
+            JSON.stringify({
+              type: "echo",
+              seq: json.timing.seq,
+              received: received,
+              rendered: nowMs(),
+            })
+          );
+        });
+      }
     };
   }, []);
 